@@ -1,15 +1,25 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import wait
 from utils.firebase_db import (add_book, edit_book, delete_book, get_books,
                                add_bookshelf, edit_bookshelf, delete_bookshelf, get_bookshelves,
                                add_owner, edit_owner, delete_owner, get_owners,
-                               generate_tracking_number, db,
+                               generate_tracking_number, preview_tracking_number, db,
                                get_all_users, update_user_access, delete_user,
-                               lend_book, return_book, get_active_loans, get_loan_history)
-from utils.book_api import search_book_by_title
+                               lend_books, return_books, get_loan_history_page, get_due_index,
+                               warm_books_cache, get_books_page, BOOKS_PAGE_SIZE,
+                               get_book, get_books_by_ids)
+from utils.book_api import (normalize_isbn, looks_like_isbn, submit_book_lookup, CircuitOpenError,
+                            get_lookup_cache_stats, get_circuit_status)
+from utils.enrichment import enrich_catalog
+from utils.export import export_file, export_file_name, parquet_available, FORMATS
+from utils.catalog import (get_resolved_catalog, get_recent_books, search_catalog, query_catalog,
+                           get_resolved_books, resolve_books, FACETS, TABLE_COLUMNS)
+from utils.overdue import DUE_BUCKETS, OVERDUE_BUCKETS
 from utils.auth import check_authentication, show_user_info_sidebar, can_add_edit_delete, can_view
-from utils.auth_utils import is_admin, get_user_profile, update_user_profile
+from utils.auth_utils import (is_admin, get_user_profile, update_user_profile, migrate_user_documents,
+                              get_access_cache_stats)
 
 # Page configuration
 st.set_page_config(
@@ -84,6 +94,188 @@ def display_book_stats(books):
                           book['publish_date'].startswith(str(current_year)))
         st.metric(f"{current_year} Releases", recent_books)
 
+def current_page(key, total, reset_on=None):
+    """Returns (page, page_count) for a list of total books; back to page 0 whenever reset_on changes"""
+    if st.session_state.get(f"{key}_filter") != reset_on:
+        st.session_state[f"{key}_filter"] = reset_on
+        st.session_state[key] = 0
+    page_count = max((total + BOOKS_PAGE_SIZE - 1) // BOOKS_PAGE_SIZE, 1)
+    page = min(st.session_state.get(key, 0), page_count - 1)
+    return page, page_count
+
+def load_cursor_page(key, fetch_page, reset_on=None):
+    """
+    Current page from fetch_page(cursor) -> (items, next_cursor). Cursors of the pages
+    visited so far are kept in session state; back to page 0 whenever reset_on changes.
+    Returns (page, items, has_next).
+    """
+    if st.session_state.get(f"{key}_cursor_filter") != reset_on:
+        st.session_state[f"{key}_cursor_filter"] = reset_on
+        st.session_state[key] = 0
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    page = min(st.session_state.get(key, 0), len(cursors) - 1)
+    items, next_cursor = fetch_page(cursors[page])
+    del cursors[page + 1:]
+    if next_cursor is not None:
+        cursors.append(next_cursor)
+    return page, items, next_cursor is not None
+
+def load_books_page(key):
+    """
+    Current page of books read straight from Firestore, used while the catalog cache is
+    still loading. Returns (page, books, has_next).
+    """
+    page, books, has_next = load_cursor_page(key, lambda cursor: get_books_page(BOOKS_PAGE_SIZE, cursor))
+    return page, resolve_books(books), has_next
+
+def page_controls(key, page, has_next, page_count=None):
+    """Previous/Next buttons under a page of books"""
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("◀ Previous", key=f"{key}_prev", disabled=page == 0, width="stretch"):
+            st.session_state[key] = page - 1
+            st.rerun()
+    with col_info:
+        st.caption(f"Page {page + 1} of {page_count}" if page_count else f"Page {page + 1}")
+    with col_next:
+        if st.button("Next ▶", key=f"{key}_next", disabled=not has_next, width="stretch"):
+            st.session_state[key] = page + 1
+            st.rerun()
+
+LOOKUP_POLL_INTERVAL = 1   # seconds between checks on a running Google Books lookup
+LOOKUP_QUICK_WAIT = 0.25   # cached and fail-fast answers come back within this, without a poll
+
+def start_book_lookup(key, isbn=None, title=None, **context):
+    """Start a background Google Books lookup; lookup_progress(key, ...) picks up its result"""
+    st.session_state[key] = {'future': submit_book_lookup(isbn=isbn, title=title), **context}
+
+def lookup_error_message(error):
+    """User-facing warning for a failed lookup"""
+    if isinstance(error, CircuitOpenError):
+        return ("⚠️ Google Books is not responding, so lookups are paused for a moment. "
+                "Please enter the details manually or try again shortly.")
+    return "⚠️ Could not reach Google Books. Please enter the details manually or try again."
+
+def lookup_progress(key, on_done):
+    """
+    Shows a running lookup without blocking the page; once it finishes, calls
+    on_done(lookup, book_info, error) and reruns the page. Nothing is rendered (and
+    nothing polls the server) while no lookup is pending.
+    """
+    if st.session_state.get(key) is not None:
+        _poll_lookup(key, on_done)
+
+@st.fragment(run_every=LOOKUP_POLL_INTERVAL)
+def _poll_lookup(key, on_done):
+    lookup = st.session_state.get(key)
+    if lookup is None:
+        return
+    future = lookup['future']
+    wait([future], timeout=LOOKUP_QUICK_WAIT)
+    if not future.done():
+        col_status, col_cancel = st.columns([3, 1])
+        with col_status:
+            st.info("🔍 Searching Google Books...")
+        with col_cancel:
+            if st.button("Cancel", key=f"{key}_cancel", width="stretch"):
+                st.session_state.pop(key, None)
+                st.rerun()
+        return
+    st.session_state.pop(key, None)
+    try:
+        book_info, error = future.result(), None
+    except Exception as e:
+        book_info, error = None, e
+    on_done(lookup, book_info, error)
+    st.rerun()
+
+def export_controls(dataset, label):
+    """Format picker and a download button exporting the whole dataset (utils.export)"""
+    st.caption(f"Downloads every {label.lower()} record, read from the database page by page. "
+               "Parquet keeps column types and is much smaller for large exports. The finished "
+               "file passes through the app server's memory, so export very large collections "
+               f"from the command line: `python -m utils.export {dataset} --format parquet`.")
+    formats = ['csv'] + (['parquet'] if parquet_available() else [])
+    col_format, col_download = st.columns([1, 3])
+    with col_format:
+        fmt = st.selectbox("Format", formats, format_func=str.upper, key=f"export_{dataset}_format",
+                           label_visibility="collapsed")
+    with col_download:
+        # The export only runs when the button is clicked, off the script thread
+        st.download_button(f"⬇️ Export {label}", data=lambda: export_file(dataset, fmt),
+                           file_name=export_file_name(dataset, fmt), mime=FORMATS[fmt],
+                           key=f"export_{dataset}_download", on_click="ignore", width="stretch")
+
+def display_book_cards(books):
+    """Display books in expandable cards (full records are read for these books only)"""
+    full_records = {book['id']: book for book in get_books_by_ids([book['id'] for book in books])}
+    for book in books:
+        book = {**book, **full_records.get(book['id'], {})}
+        authors_str = book['authors_str'] or 'N/A'
+        shelf_title = book['shelf_title']
+        owner_name = book['owner_name']
+
+        # Get lending status for card title
+        is_lent = book.get('is_lent', False)
+        status_icon = "🔴" if is_lent else "🟢"
+
+        with st.expander(f"{status_icon} {book.get('title', 'No Title')} - {book.get('tracking_number', 'No Tracking')}"):
+            # Show lending status prominently if lent
+            if is_lent:
+                st.error(f"🔴 **LENT OUT** - Borrowed by: {book.get('lent_to', 'Unknown')} on {book.get('lent_date', 'Unknown')}")
+            else:
+                st.success("🟢 **AVAILABLE**")
+
+            st.markdown("---")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**Tracking #:** {book.get('tracking_number', 'N/A')}")
+                st.write(f"**Author(s):** {authors_str}")
+                st.write(f"**Publisher:** {book.get('publisher', 'N/A')}")
+                st.write(f"**ISBN:** {book.get('isbn', 'N/A')}")
+                st.write(f"**Pages:** {book.get('page_count', 'N/A')}")
+            with col2:
+                st.write(f"**Edition:** {book.get('edition', 'N/A')}")
+                st.write(f"**Publish Date:** {book.get('publish_date', 'N/A')}")
+                st.write(f"**Owner:** {owner_name if owner_name else 'Not assigned'}")
+                st.write(f"**Bookshelf:** {shelf_title if shelf_title else 'Not assigned'}")
+                if book.get('preview_url'):
+                    st.markdown(f"[📖 Google Books Preview]({book['preview_url']})")
+            st.caption(f"Firestore ID: {book.get('id', 'N/A')}")
+
+def apply_add_book_lookup(lookup, book_info, error):
+    """Fill the Add Book form from a finished lookup"""
+    if error is not None:
+        st.session_state.add_book_notice = ('warning', lookup_error_message(error), None)
+    elif book_info:
+        st.session_state.book_data['title'] = book_info.get('title', '')
+        st.session_state.book_data['authors'] = book_info.get('authors', '')
+        st.session_state.book_data['publisher'] = book_info.get('publisher', '')
+        st.session_state.book_data['page_count'] = str(book_info.get('page_count', ''))
+        st.session_state.book_data['isbn'] = book_info.get('isbn', '')
+        st.session_state.book_data['preview_url'] = book_info.get('preview_url', '')
+
+        # Parse publish date
+        if book_info.get('published_date'):
+            try:
+                st.session_state.book_data['publish_date'] = datetime.strptime(
+                    book_info['published_date'], '%Y-%m-%d'
+                ).date()
+            except:
+                st.session_state.book_data['publish_date'] = datetime.now().date()
+
+        st.session_state.add_book_notice = (
+            'success', "✅ Book information found! Fields populated below.", book_info)
+    elif lookup['isbn_query']:
+        st.session_state.book_data['isbn'] = lookup['isbn_query']
+        st.session_state.add_book_notice = (
+            'warning', "⚠️ No book found for this ISBN. Please enter the details manually.", None)
+    else:
+        st.session_state.add_book_notice = (
+            'warning', "⚠️ No information found for this title. Please enter the details manually.", None)
+
 def add_book_page():
     """Add book page with improved UI"""
     st.markdown("<h2>📖 Add New Book</h2>", unsafe_allow_html=True)
@@ -107,9 +299,9 @@ def add_book_page():
     col_title, col_search = st.columns([3, 1])
 
     with col_title:
-        title_input = st.text_input("Title*",
+        title_input = st.text_input("Title or ISBN*",
                                     value=st.session_state.book_data['title'],
-                                    placeholder="Enter book title",
+                                    placeholder="Enter book title, or type/scan an ISBN",
                                     key="title_input")
 
     with col_search:
@@ -117,46 +309,40 @@ def add_book_page():
         st.write("")  # Spacer for alignment
         search_button = st.button("🔍 Search", width="stretch", type="secondary")
 
+    # An ISBN gets an exact lookup; a scanned one arrives with Enter rather than a click
+    isbn_query = normalize_isbn(title_input)
+    scanned = isbn_query is not None and st.session_state.get('last_isbn_lookup') != isbn_query
+    bad_isbn = isbn_query is None and looks_like_isbn(title_input)
+
     # Handle search button click
-    if search_button:
+    if search_button or scanned or bad_isbn:
         if not title_input or not title_input.strip():
             st.warning("⚠️ Please enter a book title to search.")
+        elif bad_isbn:
+            st.warning("⚠️ That looks like an ISBN but its check digit is wrong. Please re-check the number.")
+        elif isbn_query:
+            st.session_state.last_isbn_lookup = isbn_query
+            start_book_lookup('add_book_lookup', isbn=isbn_query, isbn_query=isbn_query)
         else:
-            with st.spinner("Searching for book information..."):
-                book_info = search_book_by_title(title_input)
-
-                if book_info:
-                    st.success("✅ Book information found! Fields populated below.")
-                    st.session_state.book_data['title'] = book_info.get('title', '')
-                    st.session_state.book_data['authors'] = book_info.get('authors', '')
-                    st.session_state.book_data['publisher'] = book_info.get('publisher', '')
-                    st.session_state.book_data['page_count'] = str(book_info.get('page_count', ''))
-                    st.session_state.book_data['isbn'] = book_info.get('isbn', '')
-                    st.session_state.book_data['preview_url'] = book_info.get('preview_url', '')
-
-                    # Parse publish date
-                    if book_info.get('published_date'):
-                        try:
-                            st.session_state.book_data['publish_date'] = datetime.strptime(
-                                book_info['published_date'], '%Y-%m-%d'
-                            ).date()
-                        except:
-                            st.session_state.book_data['publish_date'] = datetime.now().date()
-
-                    # Show additional info in expander
-                    with st.expander("📋 Additional Information Found"):
-                        if book_info.get('description'):
-                            st.write(f"**Description:** {book_info['description'][:300]}...")
-                        if book_info.get('isbn'):
-                            st.write(f"**ISBN:** {book_info['isbn']}")
-                        if book_info.get('page_count'):
-                            st.write(f"**Pages:** {book_info['page_count']}")
-                        if book_info.get('categories'):
-                            st.write(f"**Categories:** {book_info['categories']}")
-
-                    st.rerun()
-                else:
-                    st.warning("⚠️ No information found for this title. Please enter the details manually.")
+            start_book_lookup('add_book_lookup', title=title_input, isbn_query=None)
+
+    lookup_progress('add_book_lookup', apply_add_book_lookup)
+
+    notice = st.session_state.pop('add_book_notice', None)
+    if notice:
+        kind, message, book_info = notice
+        getattr(st, kind)(message)
+        if book_info:
+            # Show additional info in expander
+            with st.expander("📋 Additional Information Found"):
+                if book_info.get('description'):
+                    st.write(f"**Description:** {book_info['description'][:300]}...")
+                if book_info.get('isbn'):
+                    st.write(f"**ISBN:** {book_info['isbn']}")
+                if book_info.get('page_count'):
+                    st.write(f"**Pages:** {book_info['page_count']}")
+                if book_info.get('categories'):
+                    st.write(f"**Categories:** {book_info['categories']}")
 
     st.markdown("---")
 
@@ -212,7 +398,7 @@ def add_book_page():
                                    placeholder="Preview URL (auto-populated from search)")
 
         # Show generated tracking number
-        tracking_num = generate_tracking_number()
+        tracking_num = preview_tracking_number()
         st.info(f"📋 **Tracking Number:** {tracking_num} (will be auto-assigned)")
 
         st.markdown("**Required fields*")
@@ -300,53 +486,22 @@ def add_book_page():
     st.markdown("### 📚 Recently Added Books")
     st.caption("Showing the 10 most recently added books")
 
-    books = get_books()
-    if books:
-        # Sort books by creation timestamp (most recent first) in descending order
-        # Books with no created_at timestamp will be sorted to the end
-        recent_books = sorted(
-            books,
-            key=lambda x: x.get('created_at', '1900-01-01T00:00:00'),
-            reverse=True
-        )[:10]
-
+    # Most recent first (by created_at), already joined to shelf and owner
+    recent_books = get_recent_books(10)
+    if recent_books:
         # Create table data
         table_data = []
-        bookshelves = get_bookshelves()
-        owners = get_owners()
 
         for book in recent_books:
-            authors_str = book.get('authors', 'N/A')
-            if isinstance(authors_str, list):
-                authors_str = ", ".join(authors_str)
-
-            # Get bookshelf title
-            shelf_id = book.get('bookshelf_id', '')
-            shelf_title = ''
-            if shelf_id:
-                matching_shelf = next((s for s in bookshelves if str(s.get('shelf_id')) == str(shelf_id)), None)
-                if matching_shelf:
-                    shelf_title = matching_shelf.get('title', '')
-
-            # Get owner name
-            owner_id = book.get('owner_id', '')
-            owner_name = ''
-            if owner_id:
-                matching_owner = next((o for o in owners if str(o.get('owner_id')) == str(owner_id)), None)
-                if matching_owner:
-                    owner_name = matching_owner.get('name', '')
-
-            # Get year from publish_date
-            pub_date = book.get('publish_date', '')
-            year = pub_date[:4] if pub_date and len(pub_date) >= 4 else 'N/A'
+            authors_str = book['authors_str'] or 'N/A'
 
             table_data.append({
                 "Tracking #": book.get('tracking_number', 'N/A'),
                 "Title": book.get('title', 'N/A')[:40] + "..." if len(book.get('title', '')) > 40 else book.get('title', 'N/A'),
                 "Author(s)": authors_str[:30] + "..." if len(authors_str) > 30 else authors_str,
-                "Year": year,
-                "Owner": owner_name if owner_name else 'N/A',
-                "Bookshelf": shelf_title if shelf_title else 'N/A',
+                "Year": book['year'] or 'N/A',
+                "Owner": book['owner_name'] or 'N/A',
+                "Bookshelf": book['shelf_title'] or 'N/A',
             })
 
         df = pd.DataFrame(table_data)
@@ -358,7 +513,13 @@ def view_books_page():
     """View books page with improved table display"""
     st.markdown("<h2>📚 Library Collection</h2>", unsafe_allow_html=True)
 
-    books = get_books()
+    if not warm_books_cache():
+        # Cold start: browse by title one page of reads at a time while the catalog loads
+        view_books_while_loading()
+        return
+
+    # Books already joined to shelf title, owner name and lending status
+    books = get_resolved_catalog()
 
     if not books:
         st.info("📭 No books in the library yet. Add your first book!")
@@ -375,269 +536,206 @@ def view_books_page():
     # Search and view mode in same row
     search_col1, search_col2 = st.columns([3, 1])
     with search_col1:
-        search_term = st.text_input("Search books", placeholder="Search by title, author, or publisher", label_visibility="collapsed")
+        search_term = st.text_input("Search books", placeholder="Search by title, author, publisher, ISBN or tracking #", label_visibility="collapsed")
     with search_col2:
         view_mode = st.selectbox("View Mode", ["Table", "Cards"], label_visibility="collapsed")
 
     # Filter controls in separate row
-    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+
+    shelf_titles = {str(shelf.get('shelf_id')): shelf.get('title') for shelf in get_bookshelves()}
+    owner_names = {str(owner.get('owner_id')): owner.get('name') for owner in get_owners()}
+
+    # Option counts come from the facet index and depend on the search and the other
+    # filters, so read the current selections before drawing the dropdowns
+    selected = {facet: st.session_state.get(f"view_facet_{facet}") for facet in FACETS}
+    for facet, known in (('bookshelf_id', shelf_titles), ('owner_id', owner_names)):
+        if selected[facet] is not None and selected[facet] not in known:
+            # Shelf/owner deleted since the last run
+            del st.session_state[f"view_facet_{facet}"]
+            selected[facet] = None
+    filtered, counts = query_catalog(search_term, selected)
+
+    def facet_label(facet, name, all_label):
+        def label(value):
+            if value is None:
+                return all_label
+            return f"{name(value)} ({counts[facet].get(value, 0)})"
+        return label
 
     with filter_col1:
-        # Bookshelf filter
-        bookshelves = get_bookshelves()
-        shelf_filter_options = ['All Bookshelves'] + [f"{shelf.get('shelf_id')} - {shelf.get('title')}" for shelf in bookshelves]
-        selected_shelf_filter = st.selectbox("📚 Bookshelf", shelf_filter_options)
+        st.selectbox("📚 Bookshelf", [None] + list(shelf_titles), key="view_facet_bookshelf_id",
+                     format_func=facet_label('bookshelf_id', lambda v: f"{v} – {shelf_titles[v]}", 'All Bookshelves'))
 
     with filter_col2:
-        # Owner filter
-        owners = get_owners()
-        owner_filter_options = ['All Owners'] + [f"{owner.get('owner_id')} - {owner.get('name')}" for owner in owners]
-        selected_owner_filter = st.selectbox("👤 Owner", owner_filter_options)
+        st.selectbox("👤 Owner", [None] + list(owner_names), key="view_facet_owner_id",
+                     format_func=facet_label('owner_id', lambda v: f"{v} – {owner_names[v]}", 'All Owners'))
 
     with filter_col3:
-        # Publish year filter - extract unique years from books
-        years = set()
-        for book in books:
-            pub_date = book.get('publish_date', '')
-            if pub_date and len(pub_date) >= 4:
-                try:
-                    years.add(pub_date[:4])
-                except:
-                    pass
-        year_options = ['All Years'] + sorted(list(years), reverse=True)
-        selected_year_filter = st.selectbox("📅 Publish Year", year_options)
-
-    # Apply filters
-    filtered_books = books
-
-    # Text search filter
-    if search_term:
-        search_term_lower = search_term.lower()
-        filtered_books = [
-            book for book in filtered_books
-            if search_term_lower in book.get('title', '').lower() or
-               search_term_lower in str(book.get('authors', '')).lower() or
-               search_term_lower in book.get('publisher', '').lower()
-        ]
-
-    # Bookshelf filter
-    if selected_shelf_filter != 'All Bookshelves':
-        selected_shelf_id = selected_shelf_filter.split(' - ')[0]
-        filtered_books = [
-            book for book in filtered_books
-            if str(book.get('bookshelf_id', '')) == selected_shelf_id
-        ]
-
-    # Owner filter
-    if selected_owner_filter != 'All Owners':
-        selected_owner_id = selected_owner_filter.split(' - ')[0]
-        filtered_books = [
-            book for book in filtered_books
-            if str(book.get('owner_id', '')) == selected_owner_id
-        ]
-
-    # Year filter
-    if selected_year_filter != 'All Years':
-        filtered_books = [
-            book for book in filtered_books
-            if book.get('publish_date', '').startswith(selected_year_filter)
-        ]
+        years = set(counts['year']) | ({selected['year']} - {None})
+        st.selectbox("📅 Publish Year", [None] + sorted(years, reverse=True), key="view_facet_year",
+                     format_func=facet_label('year', str, 'All Years'))
+
+    with filter_col4:
+        st.selectbox("📤 Status", [None, False, True], key="view_facet_is_lent",
+                     format_func=facet_label('is_lent', lambda v: "🔴 Lent Out" if v else "🟢 Available", 'Any Status'))
 
     # Show filter results count
-    st.info(f"📊 Showing {len(filtered_books)} of {len(books)} books")
+    st.info(f"📊 Showing {len(filtered)} of {len(books)} books")
 
-    if not filtered_books:
+    if filtered.empty:
         st.warning("No books match your filter criteria.")
         return
 
     st.markdown("---")
 
+    # Render only the visible page
+    page, page_count = current_page("view_page", len(filtered), reset_on=(search_term, *selected.values()))
+    visible = filtered.iloc[page * BOOKS_PAGE_SIZE:(page + 1) * BOOKS_PAGE_SIZE]
+
     if view_mode == "Table":
-        # Create DataFrame for table view
-        df_data = []
-
-        # Fetch bookshelves and owners once (already fetched above for filters)
-        # Reuse the data we already have
-        all_bookshelves = bookshelves  # Already fetched on line 328
-        all_owners = owners  # Already fetched on line 334
-
-        for book in filtered_books:
-            authors_str = book.get('authors', 'N/A')
-            if isinstance(authors_str, list):
-                authors_str = ", ".join(authors_str)
-
-            # Get bookshelf title
-            shelf_id = book.get('bookshelf_id', '')
-            shelf_title = ''
-            if shelf_id:
-                matching_shelf = next((s for s in all_bookshelves if str(s.get('shelf_id')) == str(shelf_id)), None)
-                if matching_shelf:
-                    shelf_title = matching_shelf.get('title', '')
-
-            # Get owner name
-            owner_id = book.get('owner_id', '')
-            owner_name = ''
-            if owner_id:
-                matching_owner = next((o for o in all_owners if str(o.get('owner_id')) == str(owner_id)), None)
-                if matching_owner:
-                    owner_name = matching_owner.get('name', '')
-
-            # Get lending status
-            is_lent = book.get('is_lent', False)
-            if is_lent:
-                lent_to = book.get('lent_to', 'Unknown')
-                lent_date = book.get('lent_date', 'Unknown')
-                status = f"🔴 Lent to {lent_to}"
-            else:
-                status = "🟢 Available"
+        df = visible[list(TABLE_COLUMNS)].rename(columns=TABLE_COLUMNS)
+        st.dataframe(df, width="stretch", hide_index=True)
 
-            df_data.append({
-                "Tracking #": book.get('tracking_number', 'N/A'),
-                "Title": book.get('title', 'N/A'),
-                "Author(s)": authors_str,
-                "Owner": owner_name if owner_name else 'N/A',
-                "Bookshelf": shelf_title if shelf_title else 'N/A',
-                "Status": status,
-                "ISBN": book.get('isbn', 'N/A')
-            })
+    else:  # Cards view
+        display_book_cards(get_resolved_books(visible.index))
+
+    page_controls("view_page", page, page < page_count - 1, page_count)
 
-        df = pd.DataFrame(df_data)
+def view_books_while_loading():
+    """View Books before the catalog cache has loaded: title-ordered pages read directly"""
+    st.info("⏳ Loading the full catalog in the background. Search, filters and statistics "
+            "will appear when it is ready; meanwhile books are listed by title.")
+
+    view_mode = st.selectbox("View Mode", ["Table", "Cards"], label_visibility="collapsed")
+    page, books, has_next = load_books_page("view_page")
+
+    if not books and page == 0:
+        st.info("📭 No books in the library yet. Add your first book!")
+        return
+
+    if view_mode == "Table":
+        df = pd.DataFrame([{label: book.get(column) or 'N/A' for column, label in TABLE_COLUMNS.items()}
+                           for book in books])
         st.dataframe(df, width="stretch", hide_index=True)
+    else:
+        display_book_cards(books)
 
-    else:  # Cards view
-        # Display books in expandable cards
-        # Reuse bookshelves and owners data already fetched above
-        all_bookshelves = bookshelves  # Already fetched on line 328
-        all_owners = owners  # Already fetched on line 334
-
-        for book in filtered_books:
-            authors_str = book.get('authors', 'N/A')
-            if isinstance(authors_str, list):
-                authors_str = ", ".join(authors_str)
-
-            # Get bookshelf title
-            shelf_id = book.get('bookshelf_id', '')
-            shelf_title = ''
-            if shelf_id:
-                matching_shelf = next((s for s in all_bookshelves if str(s.get('shelf_id')) == str(shelf_id)), None)
-                if matching_shelf:
-                    shelf_title = matching_shelf.get('title', '')
-
-            # Get owner name
-            owner_id = book.get('owner_id', '')
-            owner_name = ''
-            if owner_id:
-                matching_owner = next((o for o in all_owners if str(o.get('owner_id')) == str(owner_id)), None)
-                if matching_owner:
-                    owner_name = matching_owner.get('name', '')
-
-            # Get lending status for card title
-            is_lent = book.get('is_lent', False)
-            status_icon = "🔴" if is_lent else "🟢"
-
-            with st.expander(f"{status_icon} {book.get('title', 'No Title')} - {book.get('tracking_number', 'No Tracking')}"):
-                # Show lending status prominently if lent
-                if is_lent:
-                    st.error(f"🔴 **LENT OUT** - Borrowed by: {book.get('lent_to', 'Unknown')} on {book.get('lent_date', 'Unknown')}")
-                else:
-                    st.success("🟢 **AVAILABLE**")
+    page_controls("view_page", page, has_next)
 
-                st.markdown("---")
+def apply_edit_book_lookup(lookup, book_info, error):
+    """Fill the empty fields of the book being edited from a finished lookup"""
+    selected_book = lookup['book']
+    if error is not None:
+        st.session_state.edit_book_notice = ('warning', lookup_error_message(error))
+    elif book_info:
+        # Only update fields that are empty or missing
+        updated_fields = []
 
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**Tracking #:** {book.get('tracking_number', 'N/A')}")
-                    st.write(f"**Author(s):** {authors_str}")
-                    st.write(f"**Publisher:** {book.get('publisher', 'N/A')}")
-                    st.write(f"**ISBN:** {book.get('isbn', 'N/A')}")
-                    st.write(f"**Pages:** {book.get('page_count', 'N/A')}")
-                with col2:
-                    st.write(f"**Edition:** {book.get('edition', 'N/A')}")
-                    st.write(f"**Publish Date:** {book.get('publish_date', 'N/A')}")
-                    st.write(f"**Owner:** {owner_name if owner_name else 'Not assigned'}")
-                    st.write(f"**Bookshelf:** {shelf_title if shelf_title else 'Not assigned'}")
-                    if book.get('preview_url'):
-                        st.markdown(f"[📖 Google Books Preview]({book['preview_url']})")
-                st.caption(f"Firestore ID: {book.get('id', 'N/A')}")
+        if not selected_book.get('isbn') and book_info.get('isbn'):
+            st.session_state.edit_book_data['isbn'] = book_info['isbn']
+            updated_fields.append('ISBN')
+
+        if not selected_book.get('page_count') and book_info.get('page_count'):
+            st.session_state.edit_book_data['page_count'] = str(book_info['page_count'])
+            updated_fields.append('Pages')
+
+        if not selected_book.get('preview_url') and book_info.get('preview_url'):
+            st.session_state.edit_book_data['preview_url'] = book_info['preview_url']
+            updated_fields.append('Preview URL')
+
+        if not selected_book.get('publisher') and book_info.get('publisher'):
+            st.session_state.edit_book_data['publisher'] = book_info['publisher']
+            updated_fields.append('Publisher')
+
+        if not selected_book.get('publish_date') and book_info.get('published_date'):
+            st.session_state.edit_book_data['publish_date'] = book_info['published_date']
+            updated_fields.append('Publish Date')
+
+        if updated_fields:
+            st.session_state.edit_book_notice = ('success', f"✅ Updated fields: {', '.join(updated_fields)}")
+        else:
+            st.session_state.edit_book_notice = ('info', "ℹ️ All fields already have data. No updates needed.")
+    else:
+        st.session_state.edit_book_notice = ('warning', "⚠️ No information found for this title.")
 
 def edit_delete_book_page():
     """Manage books page with Edit/Delete functionality"""
     st.markdown("<h2>✏️ Manage Books</h2>", unsafe_allow_html=True)
 
-    books = get_books()
+    catalog_ready = warm_books_cache()
+    books = get_resolved_catalog() if catalog_ready else None
 
-    if books:
+    if books is None or books:
         # Search box
         st.markdown("### 🔍 Search Books")
         search_term = st.text_input(
             "Search by Title, Author, ISBN, Year, or Tracking #",
             placeholder="Enter search term...",
-            key="manage_search"
+            key="manage_search",
+            disabled=not catalog_ready
         )
 
-        # Filter books based on search
-        filtered_books = books
-        if search_term:
-            search_term_lower = search_term.lower()
-            filtered_books = [
-                book for book in books
-                if search_term_lower in book.get('title', '').lower() or
-                   search_term_lower in str(book.get('authors', '')).lower() or
-                   search_term_lower in book.get('isbn', '').lower() or
-                   search_term_lower in book.get('tracking_number', '').lower() or
-                   search_term_lower in book.get('publish_date', '')[:4]  # Year search
-            ]
-
-        st.info(f"📊 Showing {len(filtered_books)} of {len(books)} books")
-
-        if filtered_books:
+        if catalog_ready:
+            # Filter books based on search
+            filtered_books = books
+            if search_term:
+                # Inverted index over title/author/publisher/ISBN/tracking #/year, ranked
+                filtered_books = search_catalog(search_term)
+
+            st.info(f"📊 Showing {len(filtered_books)} of {len(books)} books")
+
+            page, page_count = current_page("manage_page", len(filtered_books), reset_on=search_term)
+            page_books = filtered_books[page * BOOKS_PAGE_SIZE:(page + 1) * BOOKS_PAGE_SIZE]
+            has_next = page < page_count - 1
+        else:
+            # Cold start: one page of reads at a time while the catalog loads
+            st.info("⏳ Loading the full catalog in the background; search will be available when it is ready.")
+            page, page_books, has_next = load_books_page("manage_page")
+            page_count = None
+
+        if page_books:
             st.markdown("---")
 
             # Create a table with book data
             st.markdown("### 📚 Books List")
             st.caption("Click on a row below, then use Edit or Delete buttons")
 
-            # Prepare table data
-            bookshelves = get_bookshelves()
-            owners = get_owners()
-
             table_data = []
-            for idx, book in enumerate(filtered_books):
-                authors_str = book.get('authors', 'N/A')
-                if isinstance(authors_str, list):
-                    authors_str = ", ".join(authors_str)
-
-                # Get year from publish_date
-                pub_date = book.get('publish_date', '')
-                year = pub_date[:4] if pub_date and len(pub_date) >= 4 else 'N/A'
+            for book in page_books:
+                authors_str = book['authors_str'] or 'N/A'
 
                 table_data.append({
                     "Tracking #": book.get('tracking_number', 'N/A'),
                     "Title": book.get('title', 'N/A'),
                     "Author(s)": authors_str[:40] + "..." if len(authors_str) > 40 else authors_str,
                     "ISBN": book.get('isbn', 'N/A'),
-                    "Year": year,
+                    "Year": book['year'] or 'N/A',
                 })
 
             df = pd.DataFrame(table_data)
 
-            # Display table with selection
+            # Display table with selection (keyed per page so a selection never carries over)
             event = st.dataframe(
                 df,
                 width="stretch",
                 hide_index=True,
                 on_select="rerun",
-                selection_mode="single-row"
+                selection_mode="single-row",
+                key=f"manage_table_{page}"
             )
 
+            page_controls("manage_page", page, has_next, page_count)
+
             # Get selected book
             selected_book = None
             book_id = None
 
             if event.selection.rows:
                 selected_idx = event.selection.rows[0]
-                selected_book = filtered_books[selected_idx]
-                book_id = selected_book.get('id')
+                book_id = page_books[selected_idx].get('id')
+                # The list only holds the table fields; editing needs the full record
+                selected_book = {**page_books[selected_idx], **(get_book(book_id) or {})}
 
             st.markdown("---")
 
@@ -660,43 +758,19 @@ def edit_delete_book_page():
                     with col_search2:
                         search_btn = st.button("🔍 Search & Fill", width="stretch", type="secondary")
 
+                    lookup_key = f"edit_book_lookup_{selected_book['id']}"
                     if search_btn:
                         title_to_search = selected_book.get('title', '')
                         if title_to_search:
-                            with st.spinner("Searching for book information..."):
-                                book_info = search_book_by_title(title_to_search)
-
-                                if book_info:
-                                    # Only update fields that are empty or missing
-                                    updated_fields = []
-
-                                    if not selected_book.get('isbn') and book_info.get('isbn'):
-                                        st.session_state.edit_book_data['isbn'] = book_info['isbn']
-                                        updated_fields.append('ISBN')
-
-                                    if not selected_book.get('page_count') and book_info.get('page_count'):
-                                        st.session_state.edit_book_data['page_count'] = str(book_info['page_count'])
-                                        updated_fields.append('Pages')
+                            # A valid ISBN pins the exact edition; fall back to the title
+                            start_book_lookup(lookup_key, isbn=selected_book.get('isbn'), title=title_to_search,
+                                              book=selected_book)
 
-                                    if not selected_book.get('preview_url') and book_info.get('preview_url'):
-                                        st.session_state.edit_book_data['preview_url'] = book_info['preview_url']
-                                        updated_fields.append('Preview URL')
+                    lookup_progress(lookup_key, apply_edit_book_lookup)
 
-                                    if not selected_book.get('publisher') and book_info.get('publisher'):
-                                        st.session_state.edit_book_data['publisher'] = book_info['publisher']
-                                        updated_fields.append('Publisher')
-
-                                    if not selected_book.get('publish_date') and book_info.get('published_date'):
-                                        st.session_state.edit_book_data['publish_date'] = book_info['published_date']
-                                        updated_fields.append('Publish Date')
-
-                                    if updated_fields:
-                                        st.success(f"✅ Updated fields: {', '.join(updated_fields)}")
-                                        st.rerun()
-                                    else:
-                                        st.info("ℹ️ All fields already have data. No updates needed.")
-                                else:
-                                    st.warning("⚠️ No information found for this title.")
+                    notice = st.session_state.pop('edit_book_notice', None)
+                    if notice:
+                        getattr(st, notice[0])(notice[1])
 
                     st.markdown("---")
 
@@ -706,7 +780,7 @@ def edit_delete_book_page():
                         # Check if tracking number exists, if not show warning
                         current_tracking = selected_book.get('tracking_number', '')
                         if not current_tracking:
-                            new_tracking = generate_tracking_number()
+                            new_tracking = preview_tracking_number()
                             st.warning(f"⚠️ **No tracking number!** Will auto-generate: {new_tracking}")
                         else:
                             st.info(f"📋 **Tracking Number:** {current_tracking}")
@@ -844,9 +918,37 @@ def edit_delete_book_page():
                 # No book selected
                 st.info("👆 Please select a book from the table above to edit or delete")
         else:
-            st.warning("No books match your search criteria.")
+            st.warning("No books match your search criteria." if search_term else "No books to show.")
     else:
         st.info("📭 No books available to manage. Add your first book using the 'Add Book' page!")
+        return
+
+    st.markdown("---")
+    with st.expander("🪄 Bulk Enrich Missing Details"):
+        st.caption("Looks up every book missing its ISBN, pages, publisher, publish date or preview URL on "
+                   "Google Books and fills in the empty fields. Books checked by an earlier run are skipped, "
+                   "so an interrupted run can simply be started again.")
+        recheck = st.checkbox("Also re-check books looked up by earlier runs", key="enrich_recheck")
+        if st.button("🪄 Enrich Catalog", width="stretch", key="enrich_start"):
+            progress_bar = st.progress(0.0)
+            status = st.empty()
+
+            def report(summary):
+                progress_bar.progress(summary['done'] / summary['total'] if summary['total'] else 1.0)
+                status.caption(f"{summary['done']} of {summary['total']} checked · {summary['filled']} filled · "
+                               f"{summary['not_found']} not found · {summary['failed']} failed")
+
+            with st.spinner("Looking up book details..."):
+                summary = enrich_catalog(report, recheck=recheck)
+            if summary['total'] == 0:
+                st.info("ℹ️ No incomplete books left to check.")
+            else:
+                st.success(f"✅ Filled {summary['fields_filled']} field(s) on {summary['filled']} book(s).")
+                if summary['failed']:
+                    st.warning(f"⚠️ {summary['failed']} lookup(s) failed and will be retried on the next run.")
+
+    with st.expander("📦 Export Catalog"):
+        export_controls('books', "Catalog")
 
 def manage_bookshelves_page():
     """Manage bookshelves page"""
@@ -1323,6 +1425,89 @@ def manage_users_page():
     else:
         st.info("👆 Please select a user from the table above to edit or delete")
 
+    st.markdown("---")
+    with st.expander("🔧 Maintenance"):
+        cache_stats = get_access_cache_stats()
+        st.caption(f"Access-level cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                   f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['size']} cached")
+        lookup_stats = get_lookup_cache_stats()
+        st.caption(f"Google Books lookup cache: {lookup_stats['hits']} hits "
+                   f"({lookup_stats['negative_hits']} not-found), {lookup_stats['misses']} misses "
+                   f"({lookup_stats['hit_rate']:.0%} hit rate), {lookup_stats['size']} stored")
+        circuit = get_circuit_status()
+        if circuit['state'] == 'open':
+            st.caption(f"Google Books lookups paused after {circuit['failures']} failures; "
+                       f"next try in {circuit['retry_in']:.0f}s")
+        st.caption("Move user records created before email-keyed IDs under their email address. "
+                   "Safe to run more than once.")
+        if st.button("🔁 Migrate User IDs", width="stretch"):
+            with st.spinner("Migrating user records..."):
+                moved, skipped = migrate_user_documents(db)
+            st.success(f"✅ Migrated {moved} user(s). Skipped {skipped} without an email.")
+
+# Due-date bucket -> label with status icon, indexed like DUE_BUCKETS
+BUCKET_LABELS = [f"{'⚠️' if label in OVERDUE_BUCKETS else '⏳' if start <= 3 else '✅'} {label}"
+                 for label, start in DUE_BUCKETS]
+
+def due_soon_index(today):
+    """
+    Due-date index for today's pages. Until the loans cache has loaded (it warms in the
+    background) only loans due within the due-soon window are read, by a range query.
+    """
+    due_soon_end = today + timedelta(days=DUE_BUCKETS[-1][1])
+    return get_due_index(due_before=due_soon_end.strftime("%Y-%m-%d")), due_soon_end
+
+def overdue_dashboard():
+    """Overdue counts by bucket and the overdue loans, from the due-date index"""
+    st.markdown("### Overdue Loans")
+    today = datetime.now().date()
+    due_index, _ = due_soon_index(today)
+    counts = due_index.bucket_counts(today)
+    overdue = due_index.overdue(today)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Overdue", len(overdue))
+    with col2:
+        st.metric("Due Today", counts["Due today"])
+    with col3:
+        st.metric("Due in 1-3 Days", counts["Due in 1-3 days"])
+    with col4:
+        st.metric("Active Loans", len(due_index) if due_index.complete else "…")
+
+    if not due_index.complete:
+        counts.pop(DUE_BUCKETS[-1][0])  # loans due later were not read
+    st.bar_chart(pd.Series(counts, name="Loans").rename_axis("Bucket"), horizontal=True, sort=False)
+
+    if not overdue:
+        st.success("✅ Nothing is overdue.")
+        return
+    # Only the overdue prefix of the index, not every active loan
+    days_overdue = -due_index.days_until_due(today, stop=len(overdue))
+    buckets = due_index.classify(today, stop=len(overdue))
+    df = pd.DataFrame({
+        "Tracking #": [loan.get('tracking_number', 'N/A') for loan in overdue],
+        "Book": [loan.get('book_title', 'N/A') for loan in overdue],
+        "Borrower": [loan.get('borrowed_by_name', 'N/A') for loan in overdue],
+        "Email": [loan.get('borrowed_by_email', 'N/A') for loan in overdue],
+        "Due": [loan.get('due_date', 'N/A') for loan in overdue],
+        "Days Overdue": days_overdue,
+        "Bucket": [DUE_BUCKETS[i][0] for i in buckets]
+    })
+    st.dataframe(df, width="stretch", hide_index=True)
+
+def show_lending_report(action, books, results):
+    """Summary of a bulk lend/return, listing the books that failed and why"""
+    failed = [(book, results.get(book.get('id'), (False, "Not processed"))[1])
+              for book in books if not results.get(book.get('id'), (False,))[0]]
+    done = len(books) - len(failed)
+    if done:
+        st.success(f"✅ {done} book(s) {action} successfully")
+    if failed:
+        st.error(f"❌ {len(failed)} book(s) could not be {action}:")
+        for book, message in failed:
+            st.write(f"- {book.get('title')} ({book.get('tracking_number', 'No tracking')}): {message}")
+
 def book_lending_page():
     """Admin-only book lending page"""
     st.markdown("<h2>📖 Book Lending</h2>", unsafe_allow_html=True)
@@ -1332,7 +1517,11 @@ def book_lending_page():
         st.error("🚫 Access Denied - Admin only!")
         return
 
-    tab1, tab2, tab3 = st.tabs(["📤 Lend Book", "📥 Return Book", "📊 Loan History"])
+    report = st.session_state.pop('lending_report', None)
+    if report:
+        show_lending_report(*report)
+
+    tab1, tab2, tab_overdue, tab3 = st.tabs(["📤 Lend Book", "📥 Return Book", "🚨 Overdue", "📊 Loan History"])
 
     with tab1:
         st.markdown("### Lend a Book")
@@ -1348,7 +1537,7 @@ def book_lending_page():
             else:
                 book_options = [f"{b.get('title')} - {b.get('tracking_number', 'No tracking')}"
                                for b in available_books]
-                selected_book_str = st.selectbox("Select Book*", book_options)
+                selected_book_strs = st.multiselect("Select Book(s)*", book_options)
 
                 # Get users with profiles
                 all_users = get_all_users()
@@ -1367,86 +1556,91 @@ def book_lending_page():
                 default_due = datetime.now().date() + timedelta(days=14)
                 due_date = st.date_input("Due Date*", value=default_due, min_value=datetime.now().date())
 
-                submitted = st.form_submit_button("📤 Lend Book", width="stretch")
+                submitted = st.form_submit_button("📤 Lend Book(s)", width="stretch")
 
                 if submitted:
                     if not user_options:
                         st.error("❌ No users available!")
+                    elif not selected_book_strs:
+                        st.error("❌ Please select at least one book!")
                     else:
-                        # Extract book ID
-                        selected_book = available_books[book_options.index(selected_book_str)]
-                        book_id = selected_book.get('id')
+                        # Extract book IDs
+                        option_index = {option: i for i, option in enumerate(book_options)}
+                        selected_books = [available_books[option_index[option]] for option in selected_book_strs]
 
                         # Extract user info
                         selected_user = users_with_profiles[user_options.index(selected_user_str)]
                         borrower_email = selected_user.get('email')
                         borrower_name = selected_user.get('full_name', selected_user.get('display_name'))
 
-                        # Lend book
-                        success, message = lend_book(
-                            book_id,
+                        # Lend books (batched commits)
+                        results = lend_books(
+                            [book.get('id') for book in selected_books],
                             borrower_email,
                             borrower_name,
                             st.session_state.user_email,
                             due_date.strftime("%Y-%m-%d")
                         )
-
-                        if success:
-                            st.success(f"✅ {message}")
-                            st.balloons()
-                            st.rerun()
-                        else:
-                            st.error(f"❌ {message}")
+                        st.session_state.lending_report = ('lent', selected_books, results)
+                        st.rerun()
 
     with tab2:
-        st.markdown("### Return a Book")
+        st.markdown("### Return Books")
 
-        active_loans = get_active_loans()
+        today = datetime.now().date()
+        # Same cold-cache path as the Overdue tab, so neither blocks on loading every loan
+        due_index, due_soon_end = due_soon_index(today)
+        if not due_index.complete:
+            st.info(f"⏳ Loading all active loans in the background - showing loans due before "
+                    f"{due_soon_end.strftime('%Y-%m-%d')} for now.")
 
-        if not active_loans:
-            st.info("📭 No active loans.")
+        if not len(due_index):
+            st.info("📭 No active loans." if due_index.complete else "📭 No loans due soon.")
         else:
-            for loan in active_loans:
-                with st.expander(f"📕 {loan.get('book_title')} - {loan.get('tracking_number')}"):
-                    col1, col2 = st.columns(2)
+            # Soonest due first; status and days left computed for all loans at once
+            loans = due_index.loans + due_index.undated
+            days_left = due_index.days_until_due(today).tolist() + [None] * len(due_index.undated)
+            statuses = [BUCKET_LABELS[i] for i in due_index.classify(today)] + [''] * len(due_index.undated)
+            df = pd.DataFrame({
+                "Tracking #": [loan.get('tracking_number', 'N/A') for loan in loans],
+                "Book": [loan.get('book_title', 'N/A') for loan in loans],
+                "Borrowed By": [loan.get('borrowed_by_name', 'N/A') for loan in loans],
+                "Borrowed": [loan.get('borrowed_date', 'N/A') for loan in loans],
+                "Due": [loan.get('due_date', 'N/A') for loan in loans],
+                "Days Left": pd.array(days_left, dtype='Int64'),
+                "Status": statuses
+            })
 
-                    with col1:
-                        st.write(f"**Book:** {loan.get('book_title')}")
-                        st.write(f"**Tracking #:** {loan.get('tracking_number')}")
-                        st.write(f"**Borrowed By:** {loan.get('borrowed_by_name')}")
-
-                    with col2:
-                        st.write(f"**Borrowed Date:** {loan.get('borrowed_date')}")
-                        st.write(f"**Due Date:** {loan.get('due_date')}")
-
-                        # Check if overdue
-                        try:
-                            due = datetime.strptime(loan.get('due_date'), "%Y-%m-%d").date()
-                            if due < datetime.now().date():
-                                days_overdue = (datetime.now().date() - due).days
-                                st.error(f"⚠️ **OVERDUE by {days_overdue} days!**")
-                            else:
-                                days_remaining = (due - datetime.now().date()).days
-                                if days_remaining <= 3:
-                                    st.warning(f"⚠️ Due in {days_remaining} days")
-                                else:
-                                    st.success(f"✅ {days_remaining} days remaining")
-                        except:
-                            pass
-
-                    if st.button(f"📥 Mark as Returned", key=f"return_{loan.get('id')}", width="stretch"):
-                        success, message = return_book(loan.get('book_id'))
-                        if success:
-                            st.success(f"✅ {message}")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ {message}")
+            st.caption("Select the loans being returned (click rows; shift/ctrl-click for several).")
+            event = st.dataframe(
+                df,
+                width="stretch",
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="multi-row",
+                key=f"return_table_{st.session_state.get('return_table_round', 0)}"
+            )
+            selected_loans = [loans[i] for i in event.selection.rows]
+
+            if st.button(f"📥 Mark {len(selected_loans)} as Returned", disabled=not selected_loans,
+                         width="stretch", type="primary"):
+                book_ids = [loan.get('book_id') for loan in selected_loans]
+                results = return_books(book_ids)
+                books = [{'id': loan.get('book_id'), 'title': loan.get('book_title'),
+                          'tracking_number': loan.get('tracking_number')} for loan in selected_loans]
+                st.session_state.lending_report = ('returned', books, results)
+                # New table key so the processed rows are no longer selected
+                st.session_state.return_table_round = st.session_state.get('return_table_round', 0) + 1
+                st.rerun()
+
+    with tab_overdue:
+        overdue_dashboard()
 
     with tab3:
         st.markdown("### Loan History")
 
-        # Filter options
-        col_filter1, col_filter2 = st.columns(2)
+        # Filter options (applied by the query, not after downloading the history)
+        col_filter1, col_filter2, col_filter3, col_filter4 = st.columns(4)
 
         with col_filter1:
             all_users = get_all_users()
@@ -1456,19 +1650,23 @@ def book_lending_page():
         with col_filter2:
             status_filter = st.selectbox("Status", ['All', 'Active', 'Returned'])
 
-        # Get loan history
-        if selected_user_filter == 'All Users':
-            loan_history = get_loan_history()
-        else:
-            loan_history = get_loan_history(selected_user_filter)
+        with col_filter3:
+            borrowed_from = st.date_input("Borrowed From", value=None)
+
+        with col_filter4:
+            borrowed_to = st.date_input("Borrowed To", value=None)
 
-        # Apply status filter
-        if status_filter == 'Active':
-            loan_history = [l for l in loan_history if not l.get('returned', False)]
-        elif status_filter == 'Returned':
-            loan_history = [l for l in loan_history if l.get('returned', False)]
+        filters = {
+            'email': None if selected_user_filter == 'All Users' else selected_user_filter,
+            'status': None if status_filter == 'All' else status_filter.lower(),
+            'borrowed_from': borrowed_from.strftime("%Y-%m-%d") if borrowed_from else None,
+            'borrowed_to': borrowed_to.strftime("%Y-%m-%d") if borrowed_to else None,
+        }
 
-        st.info(f"📊 Showing {len(loan_history)} loan(s)")
+        # Get one page of loan history, newest first
+        page, loan_history, has_next = load_cursor_page(
+            "history_page", lambda cursor: get_loan_history_page(**filters, cursor=cursor),
+            reset_on=tuple(filters.values()))
 
         if not loan_history:
             st.info("📭 No loan history found.")
@@ -1489,6 +1687,11 @@ def book_lending_page():
             df = pd.DataFrame(df_data)
             st.dataframe(df, width="stretch", hide_index=True)
 
+        page_controls("history_page", page, has_next)
+
+        with st.expander("📦 Export Loan History"):
+            export_controls('loans', "Loan History")
+
 def main():
     # Check authentication first
     if not check_authentication():
@@ -0,0 +1,151 @@
+"""
+Google Books Payload Benchmark
+Compares full /volumes responses with field-masked ones: bytes on the wire and parse time
+
+    python -m benchmarks.google_books_payloads            # use recorded fixtures
+    python -m benchmarks.google_books_payloads --record "Dune" "Clean Code"
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+import requests
+from utils.book_api import GOOGLE_BOOKS_BASE_URL, VOLUME_FIELDS, pick_best_volume
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def record(titles, path):
+    """Fetch full (unmasked) title-search responses and save them as a fixture"""
+    samples = []
+    for title in titles:
+        params = {'q': f'intitle:{title}', 'maxResults': 5}
+        response = requests.get(f"{GOOGLE_BOOKS_BASE_URL}/volumes", params=params, timeout=10)
+        response.raise_for_status()
+        samples.append({'query': params['q'], 'title': title, 'response': response.json()})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(samples, f, indent=1, ensure_ascii=False)
+    print(f"Recorded {len(samples)} responses to {path}")
+
+
+def apply_field_mask(data):
+    """What the API returns for VOLUMES_FIELDS_MASK, built locally from a full response"""
+    items = [{'volumeInfo': {key: value for key, value in item.get('volumeInfo', {}).items()
+                             if key in VOLUME_FIELDS}}
+             for item in data.get('items', ())]
+    return {'items': items} if items else {}
+
+
+def legacy_parse(data, title):
+    """The title-search parse before field masks: score every volume, strptime the date"""
+    if 'items' not in data or len(data['items']) == 0:
+        return None
+    best_match = None
+    best_score = 0
+    for item in data['items']:
+        book_info = item['volumeInfo']
+        score = 0
+        if book_info.get('title'):
+            score += 1
+        if book_info.get('authors'):
+            score += 2
+        if book_info.get('publisher'):
+            score += 2
+        if book_info.get('publishedDate'):
+            score += 1
+        if book_info.get('description'):
+            score += 1
+        if book_info.get('title', '').lower() == title.lower():
+            score += 5
+        if score > best_score:
+            best_score = score
+            best_match = book_info
+    if not best_match:
+        return None
+    result = {
+        'title': best_match.get('title', ''),
+        'authors': ', '.join(best_match.get('authors', [])),
+        'publisher': best_match.get('publisher', ''),
+        'published_date': best_match.get('publishedDate', ''),
+        'description': best_match.get('description', ''),
+        'page_count': best_match.get('pageCount', ''),
+        'categories': ', '.join(best_match.get('categories', [])),
+        'isbn': '',
+        'preview_url': best_match.get('previewLink', '')
+    }
+    isbn_13 = isbn_10 = None
+    for identifier in best_match.get('industryIdentifiers', []):
+        if identifier['type'] == 'ISBN_13':
+            isbn_13 = identifier['identifier']
+        elif identifier['type'] == 'ISBN_10':
+            isbn_10 = identifier['identifier']
+    result['isbn'] = isbn_13 or isbn_10 or ''
+    if result['published_date']:
+        for fmt in ['%Y-%m-%d', '%Y-%m', '%Y']:
+            try:
+                result['published_date'] = datetime.strptime(result['published_date'], fmt).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                continue
+    return result
+
+
+def _time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(samples, repeat):
+    full_bytes = trimmed_bytes = full_gzip = trimmed_gzip = 0
+    before = after = 0.0
+    for sample in samples:
+        full = json.dumps(sample['response']).encode()
+        trimmed = json.dumps(apply_field_mask(sample['response'])).encode()
+        title = sample['title']
+
+        # The trimmed payload must parse to the same book the full one did
+        assert pick_best_volume(json.loads(trimmed), title) == legacy_parse(json.loads(full), title), title
+
+        full_bytes += len(full)
+        trimmed_bytes += len(trimmed)
+        full_gzip += len(gzip.compress(full))
+        trimmed_gzip += len(gzip.compress(trimmed))
+        before += _time_per_call(lambda: legacy_parse(json.loads(full), title), repeat)
+        after += _time_per_call(lambda: pick_best_volume(json.loads(trimmed), title), repeat)
+
+    count = len(samples)
+    print(f"{count} responses, averages per response")
+    print(f"{'':12}{'raw bytes':>12}{'gzip bytes':>12}{'parse µs':>12}")
+    print(f"{'full':12}{full_bytes / count:>12.0f}{full_gzip / count:>12.0f}{before / count * 1e6:>12.1f}")
+    print(f"{'masked':12}{trimmed_bytes / count:>12.0f}{trimmed_gzip / count:>12.0f}{after / count * 1e6:>12.1f}")
+    print(f"{'reduction':12}{1 - trimmed_bytes / full_bytes:>12.0%}{1 - trimmed_gzip / full_gzip:>12.0%}"
+          f"{1 - after / before:>12.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Google Books full vs field-masked response sizes and parse time")
+    parser.add_argument('--record', nargs='+', metavar='TITLE', help="Fetch live responses for these titles")
+    parser.add_argument('--fixture', default=os.path.join(FIXTURES_DIR, 'recorded_volumes_intitle.json'),
+                        help="Where --record saves responses")
+    parser.add_argument('--repeat', type=int, default=200, help="Parses timed per response")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.fixture)
+        return
+
+    samples = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            samples.extend(json.load(f))
+    run(samples, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
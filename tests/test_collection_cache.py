@@ -0,0 +1,65 @@
+"""
+Collection Cache Tests
+Late listener events never undo newer write-through changes, and tombstones are pruned
+"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from utils.collection_cache import CollectionCache
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def _change(kind, doc_id, update_time, **data):
+    document = SimpleNamespace(id=doc_id, update_time=update_time, to_dict=lambda: data)
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=document)
+
+
+def _loaded_cache():
+    cache = CollectionCache(query=None)
+    cache._on_snapshot([], [], _at(0))  # initial (empty) snapshot
+    return cache
+
+
+def test_late_removed_event_does_not_delete_newer_put():
+    cache = _loaded_cache()
+    cache._on_snapshot([], [_change('ADDED', 'a', _at(1), title='old')], _at(1))
+    cache.put('a', {'title': 'recreated'}, _at(3))
+    cache._on_snapshot([], [_change('REMOVED', 'a', _at(1))], _at(2))
+    assert cache._docs['a']['title'] == 'recreated'
+
+
+def test_late_modified_event_does_not_resurrect_deleted_document():
+    cache = _loaded_cache()
+    cache._on_snapshot([], [_change('ADDED', 'a', _at(1), title='t')], _at(1))
+    cache.discard('a', _at(3))
+    version = cache.version
+    cache._on_snapshot([], [_change('MODIFIED', 'a', _at(2), title='late')], _at(2))
+    assert 'a' not in cache._docs and cache.version == version
+
+
+def test_removed_echo_of_discard_is_not_applied_twice():
+    cache = _loaded_cache()
+    cache._on_snapshot([], [_change('ADDED', 'a', _at(1))], _at(1))
+    cache.discard('a', _at(2))
+    version = cache.version
+    cache._on_snapshot([], [_change('REMOVED', 'a', _at(1))], _at(2))
+    assert cache.version == version
+
+
+def test_tombstones_are_pruned_once_the_listener_catches_up():
+    cache = _loaded_cache()
+    for i in range(5):
+        cache._on_snapshot([], [_change('ADDED', f'd{i}', _at(1))], _at(1))
+        cache.discard(f'd{i}', _at(2))
+    assert len(cache._times) == 5
+    cache._on_snapshot([], [_change('ADDED', 'other', _at(3))], _at(3))
+    assert set(cache._times) == {'other'} and not cache._tombstones
+    # A genuine re-creation after the prune is applied
+    cache._on_snapshot([], [_change('ADDED', 'd0', _at(4))], _at(4))
+    assert 'd0' in cache._docs
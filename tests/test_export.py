@@ -0,0 +1,44 @@
+"""
+Export Tests
+The in-app export must produce data st.download_button accepts, read one page at a time
+"""
+
+import csv
+import io
+import os
+
+os.environ.setdefault('LIBRARY_DB_BACKEND', 'memory')
+os.environ.setdefault('LIBRARY_MEMORY_SEED_BOOKS', '25')
+
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+from utils.export import EXPORTS, export_file, iter_pages, parquet_available
+from utils.firebase_db import db
+
+
+@pytest.mark.parametrize('dataset', sorted(EXPORTS))
+@pytest.mark.parametrize('fmt', ['csv', pytest.param('parquet', marks=pytest.mark.skipif(
+    not parquet_available(), reason="pyarrow not installed"))])
+def test_export_file_is_download_button_data(dataset, fmt):
+    data, _ = convert_data_to_bytes_and_infer_mime(export_file(dataset, fmt), ValueError("unsupported"))
+    assert data
+    if fmt == 'csv':
+        header = next(csv.reader(io.StringIO(data.decode('utf-8'))))
+        assert header == ['id', *EXPORTS[dataset][1]]
+    else:
+        assert data[:4] == b'PAR1'
+
+
+def test_paged_reader_holds_one_page_at_a_time():
+    page_size = 10
+    total = len(list(db.collection('books').stream()))
+    assert total > 2 * page_size
+    seen = set()
+    reads = db.reads
+    for number, page in enumerate(iter_pages('books', page_size), 1):
+        # Nothing is read ahead of the page being handed out
+        assert len(page) <= page_size
+        assert db.reads - reads <= number * page_size
+        seen.update(row['id'] for row in page)
+        del page
+    assert len(seen) == total
@@ -0,0 +1,40 @@
+"""
+Overdue Index Tests
+Before the loans cache has loaded, only loans due before the cutoff are read
+"""
+
+import os
+import time
+
+os.environ.setdefault('LIBRARY_DB_BACKEND', 'memory')
+os.environ.setdefault('LIBRARY_MEMORY_SEED_BOOKS', '25')
+
+from utils import firebase_db
+from utils.firebase_db import db, get_due_index
+
+
+def _add_loan(due_date, returned=False):
+    return db.collection('book_loans').add({'book_id': 'b', 'book_title': 'T', 'due_date': due_date,
+                                            'returned': returned})[1].id
+
+
+def test_cold_cache_reads_only_loans_due_before_cutoff():
+    soon = _add_loan('2000-01-05')
+    later = _add_loan('2999-12-31')
+    returned = _add_loan('2000-01-01', returned=True)
+    firebase_db._loans_cache.clear()  # cold start
+
+    due_index = get_due_index(due_before='2100-01-01')
+    ids = {loan['id'] for loan in due_index.loans}
+    assert not due_index.complete
+    assert soon in ids and later not in ids and returned not in ids
+
+    # The cold call started loading the cache; once loaded the full index is served
+    cache = firebase_db._loans_cache()
+    deadline = time.monotonic() + 10
+    while not cache.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    due_index = get_due_index(due_before='2100-01-01')
+    ids = {loan['id'] for loan in due_index.loans}
+    assert due_index.complete
+    assert {soon, later} <= ids and returned not in ids
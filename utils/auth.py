@@ -3,13 +3,15 @@ Unified Authentication Module
 Supports both Google OAuth and Temporary Authentication
 """
 
+import os
 import streamlit as st
 from utils.firebase_db import db
-from utils.auth_utils import create_or_update_user, get_user_access_level, is_admin
+from utils.auth_utils import create_or_update_user, get_user_access_level, invalidate_access_level, is_admin
 
 # Authentication mode configuration
 # Set to 'google' for production or 'temporary' for testing
-AUTH_MODE = 'google'  # Change to 'temporary' to use simple email/name login
+# (LIBRARY_AUTH_MODE overrides it, e.g. when running against the local memory backend)
+AUTH_MODE = os.environ.get('LIBRARY_AUTH_MODE', 'google')  # Change to 'temporary' to use simple email/name login
 
 def init_session_state():
     """Initialize authentication session state"""
@@ -76,7 +78,8 @@ def check_google_auth():
             st.error("❌ Failed to create user account")
             return False
 
-    # Refresh access level (in case admin changed it)
+    # Refresh access level (in case admin changed it) - served from the short-lived
+    # access cache, which update_user_access/delete_user invalidate
     access_level = get_user_access_level(db, st.session_state.user_email)
     st.session_state.access_level = access_level
 
@@ -109,6 +112,7 @@ def show_no_access_page():
     col1, col2, col3 = st.columns([1, 1, 1])
     with col2:
         if st.button("🔄 Refresh Access", use_container_width=True):
+            invalidate_access_level(st.session_state.user_email)
             st.rerun()
 
     if st.button("🚪 Logout"):
@@ -1,9 +1,43 @@
 import streamlit as st
+import threading
+import time
 from datetime import datetime
 
 # Admin email - hardcoded for security
 ADMIN_EMAIL = "khalid0211@gmail.com"
 
+# Users are stored under their normalized email as the document ID.
+# Keep the legacy email query as a fallback until migrate_user_documents() has run.
+LEGACY_USER_LOOKUP = True
+
+# Seconds an access level is served from the process-wide cache. Changes made through
+# update_user_access/delete_user invalidate it immediately; the TTL only bounds how
+# long edits made elsewhere (another server process, the console) take to show up.
+ACCESS_CACHE_TTL = 30
+
+_access_cache = {}  # normalized email -> (access_level, expires_at)
+_access_cache_lock = threading.Lock()
+_access_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+def normalize_email(email):
+    """Canonical form of an email address; also the users document ID"""
+    return (email or '').strip().lower()
+
+def _find_user_doc(db, email):
+    """Get the user's document by ID, falling back to the legacy email query"""
+    doc = db.collection('users').document(normalize_email(email)).get()
+    if doc.exists:
+        return doc
+
+    # Legacy documents kept the email as it was entered (any case, maybe padded),
+    # so match that as well as the normalized form
+    candidates = [value for value in dict.fromkeys((email, (email or '').strip(), normalize_email(email))) if value]
+    if LEGACY_USER_LOOKUP and candidates:
+        for user in db.collection('users').where('email', 'in', candidates).limit(1).stream():
+            return user
+
+    return None
+
 def is_admin(email):
     """Check if user is admin"""
     return email.lower() == ADMIN_EMAIL.lower()
@@ -22,36 +56,59 @@ def get_user_access_level(db, email):
         if is_admin(email):
             return "admin"
 
-        # Query users collection
-        users = db.collection('users').where('email', '==', email).stream()
-        for user in users:
-            user_data = user.to_dict()
-            return user_data.get('access_level', 'none')
+        key = normalize_email(email)
+        with _access_cache_lock:
+            cached = _access_cache.get(key)
+            if cached and cached[1] > time.monotonic():
+                _access_cache_stats['hits'] += 1
+                return cached[0]
+            _access_cache_stats['misses'] += 1
 
+        # Direct document lookup by email
+        user = _find_user_doc(db, email)
         # User not found - return none
-        return 'none'
+        access_level = user.to_dict().get('access_level', 'none') if user else 'none'
+
+        with _access_cache_lock:
+            _access_cache[key] = (access_level, time.monotonic() + ACCESS_CACHE_TTL)
+        return access_level
     except Exception as e:
         print(f"Error getting user access level: {e}")
         return 'none'
 
+def invalidate_access_level(email=None):
+    """Drop a cached access level (or all of them when email is None)"""
+    with _access_cache_lock:
+        if email is None:
+            _access_cache.clear()
+        else:
+            _access_cache.pop(normalize_email(email), None)
+        _access_cache_stats['invalidations'] += 1
+
+def get_access_cache_stats():
+    """Hit/miss counters for the access-level cache"""
+    with _access_cache_lock:
+        stats = dict(_access_cache_stats, size=len(_access_cache))
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
 def create_or_update_user(db, email, display_name=None):
     """Create or update user in Firestore"""
     try:
-        # Check if user exists
-        users = db.collection('users').where('email', '==', email).stream()
-        existing_user = None
-        user_id = None
+        # Look up with the address as entered so legacy documents stored that way are found
+        user = _find_user_doc(db, email)
+        email = normalize_email(email)
+        current_time = datetime.now().isoformat()
 
-        for user in users:
+        if user:
             existing_user = user.to_dict()
-            user_id = user.id
-            break
+            if user.id != email:
+                # Legacy auto-ID document - move it under the email key on first login
+                _rekey_user(db, user.id, email, existing_user)
 
-        current_time = datetime.now().isoformat()
-
-        if existing_user:
             # Update last login
-            db.collection('users').document(user_id).update({
+            db.collection('users').document(email).update({
                 'last_login': current_time
             })
             return existing_user
@@ -71,7 +128,8 @@ def create_or_update_user(db, email, display_name=None):
                 'approved_at': None
             }
 
-            db.collection('users').add(new_user_data)
+            db.collection('users').document(email).set(new_user_data)
+            invalidate_access_level(email)
             return new_user_data
     except Exception as e:
         print(f"Error creating/updating user: {e}")
@@ -133,8 +191,8 @@ def require_access(required_level='view'):
 def get_user_profile(db, email):
     """Get user's profile information"""
     try:
-        users = db.collection('users').where('email', '==', email).stream()
-        for user in users:
+        user = _find_user_doc(db, email)
+        if user:
             return {**user.to_dict(), 'id': user.id}
         return None
     except Exception as e:
@@ -153,3 +211,51 @@ def update_user_profile(db, user_id, full_name, cell_phone):
     except Exception as e:
         print(f"Error updating user profile: {e}")
         return False
+
+def _rekey_user(db, old_id, email, user_data):
+    """Move one user document from an auto-generated ID to its email ID"""
+    batch = db.batch()
+    batch.set(db.collection('users').document(email), {**user_data, 'email': email})
+    batch.delete(db.collection('users').document(old_id))
+    batch.commit()
+
+def migrate_user_documents(db, batch_size=200):
+    """
+    Rekey legacy users documents under their normalized email.
+
+    Each move is a set + delete, committed in batches (batch_size users per commit).
+    If a document already exists under the email ID, its fields win and the legacy
+    document only fills in what is missing.
+
+    Returns:
+        tuple: (moved, skipped) counts; skipped documents have no email
+    """
+    users = {user.id: user.to_dict() for user in db.collection('users').stream()}
+    moved = skipped = 0
+    batch = db.batch()
+    pending = 0
+
+    for user_id, user_data in list(users.items()):
+        email = normalize_email(user_data.get('email'))
+        if not email:
+            skipped += 1
+            continue
+        if user_id == email:
+            continue
+
+        merged = {**user_data, **users.get(email, {}), 'email': email}
+        users[email] = merged
+        batch.set(db.collection('users').document(email), merged)
+        batch.delete(db.collection('users').document(user_id))
+        moved += 1
+        pending += 1
+
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    return moved, skipped
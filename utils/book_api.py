@@ -1,108 +1,408 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from datetime import date
+from utils.lookup_cache import LookupCache
 
-def search_book_by_title(title):
+# Google Books API root; point it at a local stand-in server for tests
+GOOGLE_BOOKS_BASE_URL = os.environ.get('GOOGLE_BOOKS_BASE_URL', 'https://www.googleapis.com/books/v1').rstrip('/')
+
+# volumeInfo keys the app reads; the API is asked to leave everything else out (partial response)
+VOLUME_FIELDS = ('title', 'authors', 'publisher', 'publishedDate', 'description',
+                 'pageCount', 'categories', 'industryIdentifiers', 'previewLink')
+VOLUMES_FIELDS_MASK = f"items(volumeInfo({','.join(VOLUME_FIELDS)}))"
+
+REQUEST_DEADLINE = 10          # seconds for a whole lookup, retries included
+CONNECT_TIMEOUT = 3            # seconds to establish a connection
+MAX_RETRIES = 3                # extra attempts after a 429/5xx or a connection error
+RETRY_BACKOFF = 0.5            # seconds; doubles per attempt, with full jitter
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CIRCUIT_FAILURE_THRESHOLD = 3  # consecutive failed lookups that open the circuit
+CIRCUIT_RESET_TIMEOUT = 30     # seconds the circuit stays open before one probe request is let through
+
+LOOKUP_WORKERS = 4             # background lookup threads (submit_book_lookup)
+
+_session = None
+_session_lock = threading.Lock()
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second across all threads"""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        """Blocks until the caller may make its request"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling Google Books while the circuit breaker is open"""
+
+class CircuitBreaker:
     """
-    Search for book information using Google Books API.
-    Returns book metadata if found, None otherwise.
+    Stops calling a failing service for a while instead of waiting on every request.
+
+    closed: requests go through; failure_threshold consecutive failures open the circuit.
+    open: requests fail fast with CircuitOpenError until reset_timeout has passed.
+    half_open: a single probe request goes through; success closes the circuit,
+    failure opens it again for another reset_timeout.
     """
-    if not title or not title.strip():
-        return None
 
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return 'closed'
+        if self._probing or now - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_request(self):
+        """Raises CircuitOpenError unless a request may be made now"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError("Google Books is unavailable; not retrying for a while")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def status(self):
+        """{'state', 'failures', 'retry_in' (seconds until a probe is allowed, 0 if not open)}"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            retry_in = max(0.0, self._opened_at + self.reset_timeout - now) if state == 'open' else 0.0
+            return {'state': state, 'failures': self._failures, 'retry_in': retry_in}
+
+_circuit = CircuitBreaker()
+
+def get_circuit_status():
+    """State of the Google Books circuit breaker"""
+    return _circuit.status()
+
+def _counts_as_outage(error):
+    """Connection errors, timeouts, 429 and 5xx answers count against the circuit; other errors do not"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def _get_session():
+    """Shared HTTP session: keeps connections alive between lookups (no new TCP+TLS handshake each time)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # Google APIs only compress responses for clients whose User-Agent mentions gzip
+            session.headers.update({'Accept-Encoding': 'gzip', 'User-Agent': 'library-app (gzip)'})
+            _session = session
+        return _session
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before the next attempt: Retry-After if the server sent one, else jittered backoff"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+def _get_json(path, params, deadline=REQUEST_DEADLINE, rate_limiter=None):
+    """
+    GET GOOGLE_BOOKS_BASE_URL + path and return the decoded JSON.
+
+    Retries 429/5xx answers and connection errors with jittered exponential backoff,
+    but never past the deadline. Raises requests exceptions when it gives up.
+    Every attempt waits for rate_limiter first, if one is given.
+    While the circuit breaker is open, raises CircuitOpenError without a request.
+    """
+    _circuit.before_request()
     try:
-        # Google Books API endpoint
-        url = "https://www.googleapis.com/books/v1/volumes"
-        params = {
-            'q': f'intitle:{title}',
-            'maxResults': 5  # Get multiple results to find one with publisher info
-        }
+        data = _request_json(path, params, deadline, rate_limiter)
+    except Exception as e:
+        if _counts_as_outage(e):
+            _circuit.record_failure()
+        else:
+            _circuit.record_success()  # the service answered; the request itself was bad
+        raise
+    _circuit.record_success()
+    return data
 
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+def _request_json(path, params, deadline, rate_limiter):
+    url = f"{GOOGLE_BOOKS_BASE_URL}{path}"
+    give_up_at = time.monotonic() + deadline
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(f"Deadline of {deadline}s exceeded for {url}")
 
-        data = response.json()
+        response = None
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = _get_session().get(url, params=params, timeout=(min(CONNECT_TIMEOUT, remaining), remaining))
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json()
+            if attempt == MAX_RETRIES:
+                response.raise_for_status()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
 
-        if 'items' not in data or len(data['items']) == 0:
-            return None
+        delay = _retry_delay(response, attempt)
+        if time.monotonic() + delay >= give_up_at:
+            if response is not None:
+                response.raise_for_status()
+            raise requests.exceptions.Timeout(f"Deadline of {deadline}s exceeded for {url}")
+        time.sleep(delay)
 
-        # Try to find the best match with most complete information
-        best_match = None
-        best_score = 0
-
-        for item in data['items']:
-            book_info = item['volumeInfo']
-
-            # Calculate completeness score
-            score = 0
-            if book_info.get('title'):
-                score += 1
-            if book_info.get('authors'):
-                score += 2
-            if book_info.get('publisher'):
-                score += 2  # Give higher weight to publisher
-            if book_info.get('publishedDate'):
-                score += 1
-            if book_info.get('description'):
-                score += 1
-
-            # Prefer exact title matches
-            if book_info.get('title', '').lower() == title.lower():
-                score += 5
-
-            if score > best_score:
-                best_score = score
-                best_match = book_info
-
-        if not best_match:
-            return None
+# On-disk cache of Google Books answers, shared by all sessions and kept across restarts
+LOOKUP_CACHE_PATH = os.environ.get(
+    'LIBRARY_LOOKUP_CACHE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'book_lookups.sqlite3'))
+LOOKUP_CACHE_MAX_ENTRIES = 5000
+LOOKUP_CACHE_TTL = 30 * 24 * 3600      # found: 30 days
+LOOKUP_NEGATIVE_TTL = 24 * 3600        # not found: retry after a day
+
+_lookup_cache = None
+_lookup_cache_lock = threading.Lock()
 
-        book_info = best_match
-
-        # Extract relevant fields
-        result = {
-            'title': book_info.get('title', ''),
-            'authors': ', '.join(book_info.get('authors', [])),
-            'publisher': book_info.get('publisher', ''),
-            'published_date': book_info.get('publishedDate', ''),
-            'description': book_info.get('description', ''),
-            'page_count': book_info.get('pageCount', ''),
-            'categories': ', '.join(book_info.get('categories', [])),
-            'isbn': '',
-            'preview_url': book_info.get('previewLink', '')
-        }
-
-        # Extract ISBN if available (prefer ISBN_13 over ISBN_10)
-        if 'industryIdentifiers' in book_info:
-            isbn_13 = None
-            isbn_10 = None
-            for identifier in book_info['industryIdentifiers']:
-                if identifier['type'] == 'ISBN_13':
-                    isbn_13 = identifier['identifier']
-                elif identifier['type'] == 'ISBN_10':
-                    isbn_10 = identifier['identifier']
-
-            # Use ISBN_13 if available, otherwise ISBN_10
-            result['isbn'] = isbn_13 if isbn_13 else (isbn_10 if isbn_10 else '')
-
-        # Parse and format publish date
-        if result['published_date']:
+def _get_lookup_cache():
+    """Process-wide lookup cache, opened on first use (None if the cache file cannot be opened)"""
+    global _lookup_cache
+    with _lookup_cache_lock:
+        if _lookup_cache is None:
             try:
-                # Try parsing different date formats
-                for fmt in ['%Y-%m-%d', '%Y-%m', '%Y']:
-                    try:
-                        date_obj = datetime.strptime(result['published_date'], fmt)
-                        result['published_date'] = date_obj.strftime('%Y-%m-%d')
-                        break
-                    except ValueError:
-                        continue
-            except:
-                pass
-
-        return result
+                _lookup_cache = LookupCache(LOOKUP_CACHE_PATH, LOOKUP_CACHE_MAX_ENTRIES,
+                                            LOOKUP_CACHE_TTL, LOOKUP_NEGATIVE_TTL)
+            except Exception as e:
+                print(f"Error opening lookup cache: {e}")
+                return None
+        return _lookup_cache
+
+def get_lookup_cache_stats():
+    """Hit/miss statistics of the Google Books lookup cache"""
+    cache = _get_lookup_cache()
+    if cache is None:
+        return {'hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0, 'size': 0, 'hit_rate': 0.0}
+    return cache.stats()
+
+def _normalize_query(text):
+    return ' '.join(text.lower().split())
+
+def normalize_isbn(text):
+    """
+    Canonical ISBN-13 for an ISBN-10 or ISBN-13 typed with or without dashes/spaces,
+    or None if text is not a valid ISBN (wrong length or check digit).
+    """
+    if not text:
+        return None
+    compact = ''.join(ch for ch in str(text) if ch not in '- ').upper()
+    if len(compact) == 10 and compact[:9].isdigit() and (compact[9].isdigit() or compact[9] == 'X'):
+        digits = [int(ch) for ch in compact[:9]] + [10 if compact[9] == 'X' else int(compact[9])]
+        if sum((10 - i) * d for i, d in enumerate(digits)) % 11 != 0:
+            return None
+        # ISBN-10 -> ISBN-13: prefix 978 and recompute the check digit
+        compact = '978' + compact[:9]
+        return compact + str(_isbn13_check_digit(compact))
+    if len(compact) == 13 and compact.isdigit():
+        return compact if _isbn13_check_digit(compact[:12]) == int(compact[12]) else None
+    return None
+
+def _isbn13_check_digit(first_12):
+    total = sum(int(ch) * (3 if i % 2 else 1) for i, ch in enumerate(first_12))
+    return (10 - total % 10) % 10
+
+def looks_like_isbn(text):
+    """True if text has the shape of an ISBN (10 or 13 digits/X, dashes and spaces allowed), valid or not"""
+    compact = ''.join(ch for ch in str(text or '') if ch not in '- ')
+    return len(compact) in (10, 13) and compact[:-1].isdigit() and (compact[-1].isdigit() or compact[-1] in 'xX')
 
+def _cached_lookup(key, fetch, raise_errors):
+    """Answer for key from the lookup cache, else fetch() and cache its answer (failures are not cached)"""
+    cache = _get_lookup_cache()
+    if cache is not None:
+        try:
+            found, result = cache.get(key)
+            if found:
+                return result
+        except Exception as e:
+            print(f"Error reading lookup cache: {e}")
+
+    try:
+        result = fetch()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching book data: {e}")
+        if raise_errors:
+            raise
         return None
     except Exception as e:
         print(f"Error processing book data: {e}")
+        if raise_errors:
+            raise
         return None
+
+    if cache is not None:
+        try:
+            cache.put(key, result)
+        except Exception as e:
+            print(f"Error writing lookup cache: {e}")
+    return result
+
+def search_book_by_title(title, raise_errors=False, rate_limiter=None):
+    """
+    Search for book information using Google Books API.
+    Returns book metadata if found, None otherwise.
+
+    Answers (including "not found") are cached on disk by normalized title;
+    failed requests are not cached. With raise_errors, a failed request raises
+    instead of returning None, so callers can tell "not found" from "not known".
+    Cache hits never wait for rate_limiter.
+    """
+    if not title or not title.strip():
+        return None
+    return _cached_lookup(f"title:{_normalize_query(title)}",
+                          lambda: _fetch_book_by_title(title, rate_limiter), raise_errors)
+
+def search_book_by_isbn(isbn, raise_errors=False, rate_limiter=None):
+    """
+    Exact Google Books lookup by ISBN-10 or ISBN-13 (one request, cached under the ISBN-13).
+    Returns book metadata if found, None if not found or the ISBN is invalid.
+    """
+    isbn13 = normalize_isbn(isbn)
+    if isbn13 is None:
+        return None
+    return _cached_lookup(f"isbn:{isbn13}", lambda: _fetch_book_by_isbn(isbn13, rate_limiter), raise_errors)
+
+def lookup_book(isbn=None, title=None, raise_errors=False, rate_limiter=None):
+    """
+    Book metadata for an ISBN and/or a title: a valid ISBN pins the exact edition,
+    the title is the fallback. None if neither finds anything.
+    """
+    if normalize_isbn(isbn):
+        book_info = search_book_by_isbn(isbn, raise_errors, rate_limiter)
+        if book_info:
+            return book_info
+    return search_book_by_title(title, raise_errors, rate_limiter)
+
+_lookup_executor = None
+_lookup_executor_lock = threading.Lock()
+
+def submit_book_lookup(isbn=None, title=None):
+    """
+    Runs lookup_book on a background thread and returns its Future, so a page can
+    keep rendering and pick the result up on a later rerun. The Future raises
+    requests exceptions (CircuitOpenError while Google Books is failing fast).
+    """
+    global _lookup_executor
+    with _lookup_executor_lock:
+        if _lookup_executor is None:
+            _lookup_executor = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix='book-lookup')
+    return _lookup_executor.submit(lookup_book, isbn, title, True)
+
+def _fetch_book_by_isbn(isbn13, rate_limiter=None):
+    """Google Books request for one ISBN-13; None when nothing matches, raises on request errors"""
+    params = {'q': f'isbn:{isbn13}', 'maxResults': 1, 'fields': VOLUMES_FIELDS_MASK}
+    data = _get_json('/volumes', params, rate_limiter=rate_limiter)
+    if not data.get('items'):
+        return None
+    result = _parse_volume(data['items'][0].get('volumeInfo', {}))
+    result['isbn'] = result['isbn'] or isbn13
+    return result
+
+def _fetch_book_by_title(title, rate_limiter=None):
+    """Google Books request for title; None when nothing matches, raises on request errors"""
+    params = {
+        'q': f'intitle:{title}',
+        'maxResults': 5,  # Get multiple results to find one with publisher info
+        'fields': VOLUMES_FIELDS_MASK
+    }
+
+    return pick_best_volume(_get_json('/volumes', params, rate_limiter=rate_limiter), title)
+
+def pick_best_volume(data, title):
+    """Parsed metadata of the best volume in a /volumes response for title, or None"""
+    # One pass over the results: score each volume, parse only the best match
+    title_lower = title.lower()
+    best_match = None
+    best_score = 0
+    for item in data.get('items', ()):
+        book_info = item.get('volumeInfo', {})
+        score = _match_score(book_info, title_lower)
+        if score > best_score:
+            best_score = score
+            best_match = book_info
+
+    return _parse_volume(best_match) if best_match else None
+
+def _match_score(book_info, title_lower):
+    """Completeness of a volume (publisher weighted higher), plus a bonus for an exact title match"""
+    score = ((1 if book_info.get('title') else 0)
+             + (2 if book_info.get('authors') else 0)
+             + (2 if book_info.get('publisher') else 0)
+             + (1 if book_info.get('publishedDate') else 0)
+             + (1 if book_info.get('description') else 0))
+    if book_info.get('title', '').lower() == title_lower:
+        score += 5
+    return score
+
+def _parse_volume(book_info):
+    """App book metadata from a Google Books volumeInfo"""
+    # ISBN_13 preferred over ISBN_10
+    identifiers = {identifier.get('type'): identifier.get('identifier')
+                   for identifier in book_info.get('industryIdentifiers', ())}
+    return {
+        'title': book_info.get('title', ''),
+        'authors': ', '.join(book_info.get('authors', [])),
+        'publisher': book_info.get('publisher', ''),
+        'published_date': _normalize_date(book_info.get('publishedDate', '')),
+        'description': book_info.get('description', ''),
+        'page_count': book_info.get('pageCount', ''),
+        'categories': ', '.join(book_info.get('categories', [])),
+        'isbn': identifiers.get('ISBN_13') or identifiers.get('ISBN_10') or '',
+        'preview_url': book_info.get('previewLink', '')
+    }
+
+def _normalize_date(value):
+    """'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' -> 'YYYY-MM-DD'; anything else is returned unchanged"""
+    parts = value.split('-') if value else []
+    if not 1 <= len(parts) <= 3 or len(parts[0]) != 4 or not all(part.isdigit() for part in parts):
+        return value
+    try:
+        return date(*(int(part) for part in parts + ['1'] * (3 - len(parts)))).isoformat()
+    except ValueError:
+        return value
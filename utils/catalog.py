@@ -0,0 +1,305 @@
+"""
+Catalog Views
+Derived, version-keyed views over the cached books, bookshelves and owners
+"""
+
+import heapq
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.firebase_db import (get_bookshelves, get_owners, get_books_version,
+                               get_bookshelves_version, get_owners_version,
+                               get_books_snapshot, get_books_changes)
+from utils.search_index import SearchIndex
+from utils.facet_index import FacetIndex, mask_to_bitmap, bitmap_to_mask
+
+
+def get_catalog_version():
+    """Tuple that changes whenever books, bookshelves or owners change"""
+    return get_books_version(), get_bookshelves_version(), get_owners_version()
+
+
+def _authors_str(authors):
+    if isinstance(authors, list):
+        return ", ".join(authors)
+    return authors or ''
+
+
+def resolve_book(book, shelf_titles, owner_names):
+    """Join one book to its shelf title, owner name and lending status"""
+    pub_date = book.get('publish_date') or ''
+    is_lent = book.get('is_lent', False)
+    return {
+        **book,
+        'authors_str': _authors_str(book.get('authors')),
+        'shelf_title': shelf_titles.get(str(book.get('bookshelf_id', '')), ''),
+        'owner_name': owner_names.get(str(book.get('owner_id', '')), ''),
+        'year': pub_date[:4] if len(pub_date) >= 4 else '',
+        'status': f"🔴 Lent to {book.get('lent_to', 'Unknown')}" if is_lent else "🟢 Available",
+    }
+
+
+def _join_tables():
+    # Hash joins: one dict lookup per book instead of a scan over shelves/owners
+    shelf_titles = {str(shelf.get('shelf_id')): shelf.get('title', '') for shelf in get_bookshelves()}
+    owner_names = {str(owner.get('owner_id')): owner.get('name', '') for owner in get_owners()}
+    return shelf_titles, owner_names
+
+
+def resolve_books(books):
+    """Resolve a handful of books (e.g. one page) without building the whole catalog"""
+    shelf_titles, owner_names = _join_tables()
+    return [resolve_book(book, shelf_titles, owner_names) for book in books]
+
+
+def _order_key(book):
+    # Title order, the same order get_books_page() pages through
+    return (book.get('title') or '', book['id'])
+
+
+# Catalog frame columns with a facet (dropdown filter with counts) on View Books
+FACETS = ('bookshelf_id', 'owner_id', 'year', 'is_lent')
+
+# Frame columns stored as categoricals
+CATEGORICAL_COLUMNS = ('bookshelf_id', 'owner_id')
+
+# Frame column -> View Books table header
+TABLE_COLUMNS = {
+    'tracking_number': "Tracking #",
+    'title': "Title",
+    'authors_str': "Author(s)",
+    'owner_name': "Owner",
+    'shelf_title': "Bookshelf",
+    'status': "Status",
+    'isbn': "ISBN",
+}
+
+
+def _catalog_frame(books):
+    """Typed frame of resolved books, one row per book in the given order"""
+    return pd.DataFrame({
+        'tracking_number': [book.get('tracking_number', 'N/A') for book in books],
+        'title': [book.get('title', 'N/A') for book in books],
+        'authors_str': [book['authors_str'] or 'N/A' for book in books],
+        'owner_name': [book['owner_name'] or 'N/A' for book in books],
+        'shelf_title': [book['shelf_title'] or 'N/A' for book in books],
+        'status': [book['status'] for book in books],
+        'isbn': [book.get('isbn', 'N/A') for book in books],
+        'is_lent': np.array([bool(book.get('is_lent', False)) for book in books], dtype=bool),
+        'bookshelf_id': pd.Categorical([str(book.get('bookshelf_id', '')) for book in books]),
+        'owner_id': pd.Categorical([str(book.get('owner_id', '')) for book in books]),
+        'year': pd.to_numeric(pd.Series([book['year'] for book in books], dtype='string'),
+                              errors='coerce').astype('Int16').array,
+        # Everything the text search covers, lowercased once per book change
+        'search_text': pd.Series([
+            f"{book.get('title', '')} {book['authors_str']} {book.get('publisher', '')} "
+            f"{book.get('isbn', '')} {book.get('tracking_number', '')} {book['year']}"
+            for book in books
+        ], dtype='string').str.lower().array,
+    }, index=pd.Index([book['id'] for book in books], name='id'))
+
+
+def _splice_frame(frame, removed, added, positions):
+    """
+    frame without the rows at removed (old row numbers), with the rows of added
+    placed at positions (ascending row numbers in the result).
+    """
+    for column in CATEGORICAL_COLUMNS:
+        new_values = added[column].cat.categories.difference(frame[column].cat.categories)
+        if len(new_values):
+            frame = frame.assign(**{column: frame[column].cat.add_categories(new_values)})
+    # Identical dtypes (categories included) keep every column's type through the concat
+    added = added.astype(frame.dtypes.to_dict())
+
+    is_new = np.zeros(len(frame) - len(removed) + len(added), dtype=bool)
+    is_new[positions] = True
+    order = np.empty(len(is_new), dtype=np.intp)
+    order[~is_new] = np.delete(np.arange(len(frame)), removed)
+    order[is_new] = np.arange(len(frame), len(frame) + len(added))
+    return pd.concat([frame, added]).iloc[order]
+
+
+CatalogViews = namedtuple('CatalogViews', 'version books by_id frame facets')
+
+
+class ResolvedCatalog:
+    """
+    Resolved books in title order, with a by-ID map, the typed catalog frame and
+    its facet index, all kept in step with the books cache.
+
+    Like SearchIndex it catches up from the cache's change log: only the books
+    written since the last sync are re-resolved and spliced into the list, frame
+    and facet bitmaps. It is rebuilt in full when the log cannot cover the gap or
+    bookshelves/owners change (any book's join may). Each sync publishes new
+    views, so readers holding older ones are never affected.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []  # _order_key of each book in views.books
+        self.views = CatalogViews(None, [], {}, _catalog_frame([]), None)
+
+    def sync(self):
+        """Returns the current CatalogViews, patching or rebuilding them first if needed"""
+        with self._lock:
+            books_version, shelves_version, owners_version = get_catalog_version()
+            current = self.views.version
+            if current is not None and current[1:] == (shelves_version, owners_version):
+                version, changed = get_books_changes(current[0])
+                if version == current[0]:
+                    return self.views
+                if changed is not None:
+                    self._update(changed, (version, shelves_version, owners_version))
+                    return self.views
+            version, books = get_books_snapshot()
+            self._rebuild(books, (version, shelves_version, owners_version))
+            return self.views
+
+    def _rebuild(self, books, version):
+        resolved = sorted(resolve_books(books), key=_order_key)
+        frame = _catalog_frame(resolved)
+        self._keys = [_order_key(book) for book in resolved]
+        self.views = CatalogViews(version, resolved, {book['id']: book for book in resolved}, frame,
+                                  FacetIndex({facet: frame[facet] for facet in FACETS}))
+
+    def _update(self, changed, version):
+        """Apply {book_id: record or None} changes"""
+        views = self.views
+        keys, books, by_id = list(self._keys), list(views.books), dict(views.by_id)
+
+        # Take out the current row of every changed book...
+        removed = []
+        for book_id in changed:
+            if book_id in by_id:
+                removed.append(bisect_left(keys, _order_key(by_id.pop(book_id))))
+        removed.sort()
+        for position in reversed(removed):
+            del keys[position]
+            del books[position]
+
+        # ...and put the new version back in title order
+        added = sorted(resolve_books([book for book in changed.values() if book is not None]), key=_order_key)
+        positions = []
+        for book in added:
+            key = _order_key(book)
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            books.insert(position, book)
+            by_id[book['id']] = book
+            positions.append(position)
+
+        added_frame = _catalog_frame(added)
+        facets = views.facets.copy()
+        facets.delete_rows(removed)
+        facets.insert_rows(positions, {facet: added_frame[facet].tolist() for facet in FACETS})
+        self._keys = keys
+        self.views = CatalogViews(version, books, by_id,
+                                  _splice_frame(views.frame, removed, added_frame, positions), facets)
+
+
+@st.cache_resource
+def _resolved_catalog():
+    """Process-wide resolved catalog, kept in step with the books cache"""
+    return ResolvedCatalog()
+
+
+def _catalog_views():
+    return _resolved_catalog().sync()
+
+
+def get_resolved_catalog():
+    """
+    Books joined to shelf title, owner name and lending status, ordered by title.
+
+    Shared by every session and patched as books change; treat as read-only.
+    """
+    return _catalog_views().books
+
+
+@st.cache_resource(max_entries=1)
+def _build_recent_books(version, count, _books):
+    return heapq.nlargest(count, _books, key=lambda book: book.get('created_at', '1900-01-01T00:00:00'))
+
+
+def get_recent_books(count=10):
+    """Most recently added books, newest first (books without created_at sort last)"""
+    views = _catalog_views()
+    return _build_recent_books(views.version, count, views.books)
+
+
+@st.cache_resource
+def _search_index():
+    """Process-wide search index, kept in step with the books cache"""
+    return SearchIndex()
+
+
+def _synced_search_index():
+    # Incremental: only books written since the last sync are re-indexed
+    index = _search_index()
+    index.sync(get_books_changes, get_books_snapshot)
+    return index
+
+
+def search_catalog(query, books=None):
+    """
+    Resolved books matching every word of query (prefix matches allowed),
+    best matches first. Pass books to restrict the search to a subset.
+    """
+    ranked_ids = _synced_search_index().search(query)
+    by_id = _catalog_views().by_id
+    if books is not None:
+        allowed = {book['id'] for book in books}
+        ranked_ids = [book_id for book_id in ranked_ids if book_id in allowed]
+    return [by_id[book_id] for book_id in ranked_ids if book_id in by_id]
+
+
+def get_catalog_frame():
+    """
+    Resolved catalog as a typed DataFrame indexed by book ID, in title order.
+
+    Shared by every session and patched as books change; treat as read-only.
+    """
+    return _catalog_views().frame
+
+
+def _search_rows(frame, search_term):
+    """(matching row positions best first, or None when unranked; bitmap of matching rows)"""
+    ranked_ids = _synced_search_index().search(search_term)
+    if ranked_ids:
+        positions = frame.index.get_indexer(ranked_ids)
+        positions = positions[positions >= 0]
+        mask = np.zeros(len(frame), dtype=bool)
+        mask[positions] = True
+        return positions, mask_to_bitmap(mask)
+    # Nothing in the index - fall back to a substring match
+    mask = frame['search_text'].str.contains(search_term.lower(), regex=False).to_numpy(dtype=bool)
+    return None, mask_to_bitmap(mask)
+
+
+def query_catalog(search_term='', selected=None):
+    """
+    Filter the catalog by search term and facet selections ({facet: value or None}).
+
+    Returns (rows, counts): the matching rows of the catalog frame (best search
+    matches first) and, per facet, value -> number of books picking that value
+    would leave given the search and the other selections.
+    """
+    views = _catalog_views()
+    frame, facets = views.frame, views.facets
+    selected = selected or {}
+
+    ranked, base = _search_rows(frame, search_term) if search_term else (None, facets.all)
+    counts = facets.facet_counts(selected, base)
+    mask = bitmap_to_mask(base & facets.select(selected), len(frame))
+    if ranked is not None:
+        return frame.iloc[ranked[mask[ranked]]], counts
+    return frame[mask], counts
+
+
+def get_resolved_books(book_ids):
+    """Resolved book dicts for book_ids, in the same order"""
+    by_id = _catalog_views().by_id
+    return [by_id[book_id] for book_id in book_ids if book_id in by_id]
@@ -0,0 +1,294 @@
+"""
+Live Collection Cache
+Keeps a process-wide copy of a Firestore collection current through an on_snapshot listener
+"""
+
+import threading
+from collections import deque
+from datetime import timezone
+
+# Seconds to wait for the listener's first snapshot before falling back to a plain read
+INITIAL_SNAPSHOT_TIMEOUT = 30
+
+# Number of per-document changes remembered for incremental consumers (see changes_since)
+CHANGE_LOG_SIZE = 10000
+
+
+def _as_datetime(timestamp):
+    """DocumentReference.delete() returns a protobuf Timestamp; everything else here is a datetime"""
+    if hasattr(timestamp, 'ToDatetime'):
+        return timestamp.ToDatetime(tzinfo=timezone.utc)
+    return timestamp
+
+
+class CollectionCache:
+    """
+    In-memory mirror of a Firestore collection (or query).
+
+    The first snapshot delivered by the listener doubles as the initial load;
+    after that only the added/modified/removed documents are applied.
+    `version` is bumped on every change so derived views know when to rebuild.
+
+    With `fields` only those fields of each document are kept (a projected "list
+    view"); callers needing the full document read it separately.
+
+    Writers can patch the cache directly after a successful write (write-through)
+    so their own change is visible before the listener echoes it back. Each
+    document remembers the update time of the newest state applied, so a late
+    listener event never rolls a write-through patch back. Deleted documents keep
+    their delete time as a tombstone until the listener has caught up with it.
+    """
+
+    def __init__(self, query, fields=None):
+        self._query = query
+        self._fields = list(fields) if fields else None
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._docs = {}
+        self._times = {}
+        self._tombstones = set()  # IDs in _times that were deleted
+        self._records = None
+        self._views = {}
+        self._changes = deque()  # (version, doc_id), oldest first
+        self._log_start = 0      # changes_since() can answer for versions >= this
+        self._watch = None
+        self._warming = None
+        self.version = 0
+
+    def start(self):
+        """Attach the snapshot listener and wait for the initial snapshot"""
+        with self._lock:
+            if self._watch is None or not self._watch.is_active:
+                self._ready.clear()
+                try:
+                    # Snapshot listeners take no field mask; documents are trimmed to fields on arrival
+                    self._watch = self._query.on_snapshot(self._on_snapshot)
+                except Exception as e:
+                    print(f"Error starting snapshot listener: {e}")
+                    self._watch = None
+
+        if self._watch is None or not self._ready.wait(INITIAL_SNAPSHOT_TIMEOUT):
+            # Listener unavailable or slow - serve a one-off read so callers never block forever
+            self.reload()
+
+    @property
+    def ready(self):
+        """True once the initial load has completed (never blocks)"""
+        return self._ready.is_set()
+
+    def warm(self):
+        """Begin the initial load in a background thread; returns True once the cache is ready"""
+        with self._lock:
+            if not self._ready.is_set() and self._warming is None:
+                self._warming = threading.Thread(target=self._warm, daemon=True)
+                self._warming.start()
+        return self._ready.is_set()
+
+    def _warm(self):
+        try:
+            self._ensure_live()
+        except Exception as e:
+            print(f"Error loading collection cache: {e}")
+        finally:
+            with self._lock:
+                self._warming = None
+
+    def stop(self):
+        """Detach the snapshot listener"""
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+
+    def reload(self):
+        """Re-read the whole collection (used when the listener cannot be trusted)"""
+        query = self._query.select(self._fields) if self._fields else self._query
+        snapshots = list(query.stream())
+        with self._lock:
+            self._docs = {doc.id: self._to_record(doc) for doc in snapshots}
+            self._times = {doc.id: doc.update_time for doc in snapshots}
+            self._tombstones.clear()
+            self._bump(None)
+        self._ready.set()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        read_time = _as_datetime(read_time)
+        with self._lock:
+            if not self._ready.is_set():
+                # Initial (or re-attached) snapshot: replace everything we hold
+                self._docs = {doc.id: self._to_record(doc) for doc in docs}
+                self._times = {doc.id: doc.update_time for doc in docs}
+                self._tombstones.clear()
+                self._bump(None)
+            else:
+                changed = []
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        # A state written after this snapshot was read (e.g. a newer put) wins
+                        known = self._times.get(doc.id)
+                        if known is not None and read_time is not None and known > read_time:
+                            continue
+                        if self._docs.pop(doc.id, None) is None:
+                            continue  # already discarded by the writer
+                        self._forget(doc.id)
+                        if read_time is not None:
+                            self._times[doc.id] = read_time
+                            self._tombstones.add(doc.id)
+                    elif not self._is_stale(doc.id, doc.update_time):
+                        self._docs[doc.id] = self._to_record(doc)
+                        self._times[doc.id] = doc.update_time
+                        self._tombstones.discard(doc.id)
+                    else:
+                        continue
+                    changed.append(doc.id)
+                if changed:
+                    self._bump(changed)
+                self._prune_tombstones(read_time)
+        self._ready.set()
+
+    def _forget(self, doc_id):
+        # Drop what is known about a document's update time (a delete time without one)
+        self._times.pop(doc_id, None)
+        self._tombstones.discard(doc_id)
+
+    def _prune_tombstones(self, read_time):
+        # Events older than read_time have all been delivered, so tombstones up to it can go
+        if read_time is None:
+            return
+        for doc_id in [doc_id for doc_id in self._tombstones if self._times[doc_id] <= read_time]:
+            self._tombstones.discard(doc_id)
+            del self._times[doc_id]
+
+    def _project(self, data):
+        if self._fields is None:
+            return data
+        return {field: data[field] for field in self._fields if field in data}
+
+    def _to_record(self, doc):
+        return {**self._project(doc.to_dict() or {}), 'id': doc.id}
+
+    def _is_stale(self, doc_id, update_time):
+        # An equal update time is the same document state, e.g. the listener echoing a
+        # write-through patch - applying it again would only bump the version twice
+        known = self._times.get(doc_id)
+        return known is not None and update_time is not None and update_time <= known
+
+    # Write-through helpers - call only after the write has been committed
+
+    def put(self, doc_id, data, update_time=None):
+        """Insert or replace a document"""
+        with self._lock:
+            if self._is_stale(doc_id, update_time):
+                return
+            self._docs[doc_id] = {**self._project(data), 'id': doc_id}
+            self._times[doc_id] = update_time
+            self._tombstones.discard(doc_id)
+            self._bump([doc_id])
+
+    def patch(self, doc_id, fields, update_time=None):
+        """Merge updated fields into a cached document"""
+        with self._lock:
+            existing = self._docs.get(doc_id)
+            if existing is None or self._is_stale(doc_id, update_time):
+                return
+            self._docs[doc_id] = {**existing, **self._project(fields)}
+            self._times[doc_id] = update_time
+            self._bump([doc_id])
+
+    def discard(self, doc_id, update_time=None):
+        """Remove a deleted document; update_time is the delete's commit time"""
+        update_time = _as_datetime(update_time)
+        with self._lock:
+            if self._is_stale(doc_id, update_time):
+                return
+            if self._docs.pop(doc_id, None) is not None:
+                self._bump([doc_id])
+            self._forget(doc_id)
+            if update_time is not None:
+                # Keep the delete time as a tombstone so older listener events are ignored
+                self._times[doc_id] = update_time
+                self._tombstones.add(doc_id)
+
+    def refresh(self, doc_ref):
+        """Re-read one document after a write whose outcome is unknown"""
+        doc = doc_ref.get()
+        with self._lock:
+            self._forget(doc.id)
+        if doc.exists:
+            self.put(doc.id, doc.to_dict(), doc.update_time)
+        else:
+            # Absent as of the read, so anything the listener reports from before then is stale
+            self.discard(doc.id, doc.read_time)
+
+    def _bump(self, doc_ids):
+        """New version; doc_ids lists what changed, None means everything may have"""
+        self._records = None
+        self.version += 1
+        if doc_ids is None:
+            self._changes.clear()
+            self._log_start = self.version
+            return
+        for doc_id in doc_ids:
+            if len(self._changes) >= CHANGE_LOG_SIZE:
+                # Forgetting this entry means its version can no longer be diffed from
+                self._log_start = self._changes.popleft()[0]
+            self._changes.append((self.version, doc_id))
+
+    def changes_since(self, version):
+        """
+        Returns (current_version, changed) where changed maps each document ID
+        modified after `version` to its current record (None if removed).
+        changed is None when the log cannot cover the gap and a full rebuild is needed.
+        """
+        self._ensure_live()
+        with self._lock:
+            if version is None or version < self._log_start:
+                return self.version, None
+            changed = {}
+            for change_version, doc_id in reversed(self._changes):
+                if change_version <= version:
+                    break
+                if doc_id not in changed:
+                    changed[doc_id] = self._docs.get(doc_id)
+            return self.version, changed
+
+    def _ensure_live(self):
+        if self._watch is None or not self._watch.is_active or not self._ready.is_set():
+            self.start()
+
+    def records(self):
+        """Returns all cached documents as a list of dicts (treat as read-only)"""
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """Returns (version, records) as one consistent pair"""
+        self._ensure_live()
+        with self._lock:
+            if self._records is None:
+                self._records = list(self._docs.values())
+            return self.version, self._records
+
+    def view(self, name, build):
+        """
+        Returns build(records), rebuilt only when the cache version changes.
+
+        Use it for derived views (filtered subsets, groupings) that would
+        otherwise be recomputed on every Streamlit rerun.
+        """
+        version, records = self.snapshot()
+        cached = self._views.get(name)
+        if cached is None or cached[0] != version:
+            cached = self._views[name] = (version, build(records))
+        return cached[1]
+
+    def update_time(self, doc_id):
+        """Update time of the cached state of a document (None if unknown; never blocks on loading)"""
+        with self._lock:
+            return self._times.get(doc_id)
+
+    def get(self, doc_id):
+        """Returns a single cached document, or None"""
+        self._ensure_live()
+        with self._lock:
+            return self._docs.get(doc_id)
@@ -0,0 +1,146 @@
+"""
+Bulk Metadata Enrichment
+Fills missing ISBN, page count, publisher, publish date and preview URL from Google Books for the whole catalog
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from itertools import islice
+from utils.book_api import lookup_book, RateLimiter
+from utils.firebase_db import db, update_books
+
+# Book field -> Google Books result field
+ENRICHABLE_FIELDS = {
+    'isbn': 'isbn',
+    'page_count': 'page_count',
+    'publisher': 'publisher',
+    'publish_date': 'published_date',
+    'preview_url': 'preview_url',
+}
+
+# Set on every book the job has looked up, found or not, so a rerun skips it
+CHECKED_FIELD = 'enrichment_checked_at'
+
+ENRICH_WORKERS = 8      # concurrent lookups
+ENRICH_RATE = 5.0       # Google Books requests per second (cache hits are free)
+ENRICH_BATCH_SIZE = 100  # book updates per Firestore batch
+
+
+def find_incomplete_books(recheck=False):
+    """Books with a title and at least one empty enrichable field (skipping already checked ones)"""
+    fields = ['title', CHECKED_FIELD, *ENRICHABLE_FIELDS]
+    books = []
+    # Projected scan: only the fields needed to decide, not whole documents
+    for doc in db.collection('books').select(fields).stream():
+        book = {**doc.to_dict(), 'id': doc.id}
+        if not (book.get('title') or '').strip():
+            continue
+        if book.get(CHECKED_FIELD) and not recheck:
+            continue
+        if any(not book.get(field) for field in ENRICHABLE_FIELDS):
+            books.append(book)
+    return books
+
+
+def missing_fields(book, book_info):
+    """Fields of book that are empty and that book_info can fill"""
+    fills = {}
+    for field, info_field in ENRICHABLE_FIELDS.items():
+        value = book_info.get(info_field)
+        if not book.get(field) and value:
+            fills[field] = str(value)
+    return fills
+
+
+def enrich_catalog(progress=None, workers=ENRICH_WORKERS, rate=ENRICH_RATE,
+                   batch_size=ENRICH_BATCH_SIZE, recheck=False, limit=None):
+    """
+    Looks up every incomplete book and writes back the fields it was missing.
+
+    Books with a valid ISBN are looked up by ISBN first, the rest by title.
+    Lookups run on a bounded thread pool behind a shared rate limiter; updates are
+    committed in batches as results arrive, and whatever was fetched is still
+    committed if the run is interrupted. Checked books are marked, so an
+    interrupted run resumes where it stopped. Lookups that fail (network, quota,
+    or failing fast while the Google Books circuit breaker is open) are not
+    marked and are retried by the next run.
+
+    progress(summary) is called after every book. Returns the summary dict.
+    """
+    books = find_incomplete_books(recheck)
+    if limit:
+        books = books[:limit]
+    summary = {'total': len(books), 'done': 0, 'filled': 0, 'not_found': 0, 'failed': 0, 'fields_filled': 0}
+    if progress:
+        progress(summary)
+    if not books:
+        return summary
+
+    limiter = RateLimiter(rate)
+    pending = {}
+
+    def flush():
+        if pending:
+            written = set(update_books(pending))
+            summary['failed'] += len(pending) - len(written)
+            pending.clear()
+
+    # Only a bounded window of lookups is queued at a time, so an interrupted run
+    # (e.g. a Streamlit rerun raised from progress) leaves little work behind
+    pool = ThreadPoolExecutor(max_workers=workers)
+    queued = iter(books)
+    in_flight = {}
+    try:
+        while True:
+            for book in islice(queued, 2 * workers - len(in_flight)):
+                in_flight[pool.submit(lookup_book, book.get('isbn'), book['title'], True, limiter)] = book
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                book = in_flight.pop(future)
+                summary['done'] += 1
+                try:
+                    book_info = future.result()
+                except Exception:
+                    summary['failed'] += 1
+                else:
+                    fills = missing_fields(book, book_info) if book_info else {}
+                    if book_info is None:
+                        summary['not_found'] += 1
+                    elif fills:
+                        summary['filled'] += 1
+                        summary['fields_filled'] += len(fills)
+                    pending[book['id']] = {**fills, CHECKED_FIELD: datetime.now().isoformat()}
+                    if len(pending) >= batch_size:
+                        flush()
+                if progress:
+                    progress(summary)
+    finally:
+        # Don't wait for lookups still queued; write whatever was already fetched
+        pool.shutdown(wait=False, cancel_futures=True)
+        flush()
+    if progress:
+        progress(summary)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill missing book details from Google Books")
+    parser.add_argument('--workers', type=int, default=ENRICH_WORKERS)
+    parser.add_argument('--rate', type=float, default=ENRICH_RATE, help="Google Books requests per second")
+    parser.add_argument('--limit', type=int, default=None, help="Process at most this many books")
+    parser.add_argument('--recheck', action='store_true', help="Also look up books checked by earlier runs")
+    args = parser.parse_args()
+
+    def report(summary):
+        print(f"\r{summary['done']}/{summary['total']} checked, {summary['filled']} filled, "
+              f"{summary['not_found']} not found, {summary['failed']} failed", end='', flush=True)
+
+    enrich_catalog(report, args.workers, args.rate, recheck=args.recheck, limit=args.limit)
+    print()
+
+
+if __name__ == '__main__':
+    main()
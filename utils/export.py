@@ -0,0 +1,158 @@
+"""
+Data Export
+Streams the books catalog or loan history out of Firestore page by page into CSV or Parquet
+
+    python -m utils.export books --format csv --output books.csv
+    python -m utils.export loans --format parquet
+"""
+
+import argparse
+import csv
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+from utils.firebase_db import db
+
+# Documents read per query page; also the rows per Parquet row group
+EXPORT_PAGE_SIZE = 1000
+
+# Dataset -> (collection, exported fields in column order, boolean fields)
+EXPORTS = {
+    'books': ('books', [
+        'tracking_number', 'title', 'authors', 'publisher', 'edition', 'publish_date', 'page_count',
+        'isbn', 'bookshelf_id', 'owner_id', 'is_lent', 'lent_to', 'lent_date', 'lent_by',
+        'preview_url', 'created_at'
+    ], {'is_lent'}),
+    'loans': ('book_loans', [
+        'book_id', 'tracking_number', 'book_title', 'borrowed_by_email', 'borrowed_by_name',
+        'borrowed_date', 'due_date', 'returned', 'returned_date', 'approved_by'
+    ], {'returned'}),
+}
+
+FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def parquet_available():
+    """Parquet export needs the optional pyarrow package"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _cell(value, boolean):
+    """Firestore value -> export cell: bool for flag fields, else string (None stays None)"""
+    if boolean:
+        return None if value is None or value == '' else bool(value)
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_pages(dataset, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yields the rows of dataset one page at a time, in document ID order.
+
+    Each page is a projected query of page_size documents continuing after the
+    previous page's last document, so memory use does not grow with the
+    collection. Request errors are raised, never turned into a short export.
+    """
+    collection, fields, booleans = EXPORTS[dataset]
+    query = db.collection(collection).select(fields).order_by('__name__').limit(page_size)
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.stream())
+        if not docs:
+            return
+        yield [{'id': doc.id, **{field: _cell((doc.to_dict() or {}).get(field), field in booleans)
+                                 for field in fields}}
+               for doc in docs]
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def write_csv(dataset, output, page_size=EXPORT_PAGE_SIZE):
+    """Writes dataset as CSV to the binary file output, one page at a time; returns rows written"""
+    _, fields, _ = EXPORTS[dataset]
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True)
+    writer = csv.DictWriter(text, fieldnames=['id', *fields])
+    writer.writeheader()
+    rows = 0
+    for page in iter_pages(dataset, page_size):
+        writer.writerows(page)
+        rows += len(page)
+    text.flush()
+    text.detach()  # leave output open for the caller
+    return rows
+
+
+def write_parquet(dataset, output, page_size=EXPORT_PAGE_SIZE):
+    """Writes dataset as Parquet to the binary file output, one row group per page; returns rows written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _, fields, booleans = EXPORTS[dataset]
+    schema = pa.schema([('id', pa.string())] +
+                       [(field, pa.bool_() if field in booleans else pa.string()) for field in fields])
+    rows = 0
+    with pq.ParquetWriter(output, schema, compression='snappy') as writer:
+        for page in iter_pages(dataset, page_size):
+            writer.write_table(pa.Table.from_pylist(page, schema=schema))
+            rows += len(page)
+    return rows
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet}
+
+
+def export_file(dataset, fmt):
+    """
+    Exports dataset to an anonymous temporary file and returns a read handle on it,
+    rewound to the start, for st.download_button. Building the export only ever holds
+    one page in memory; Streamlit still loads the finished file to serve it, so very
+    large exports are better run from the CLI.
+    """
+    with tempfile.TemporaryFile() as output:
+        WRITERS[fmt](dataset, output)
+        output.flush()
+        # A plain buffered reader (what download_button accepts) on a duplicate of the
+        # descriptor; the file itself goes away once that reader is closed
+        reader = open(os.dup(output.fileno()), 'rb')
+    reader.seek(0)
+    return reader
+
+
+def export_file_name(dataset, fmt):
+    """Download name such as books-20240101.csv"""
+    return f"{dataset}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the books catalog or loan history")
+    parser.add_argument('dataset', choices=sorted(EXPORTS))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', help="File to write (default: <dataset>-<date>.<format>; '-' for stdout)")
+    parser.add_argument('--page-size', type=int, default=EXPORT_PAGE_SIZE, help="Documents read per query")
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and not parquet_available():
+        parser.error("Parquet export needs pyarrow (pip install pyarrow)")
+    if args.output == '-':
+        rows = WRITERS[args.format](args.dataset, sys.stdout.buffer, args.page_size)
+        sys.stdout.buffer.flush()
+        print(f"Exported {rows} {args.dataset}", file=sys.stderr)
+        return
+    path = args.output or export_file_name(args.dataset, args.format)
+    with open(path, 'wb') as output:
+        rows = WRITERS[args.format](args.dataset, output, args.page_size)
+    print(f"Exported {rows} {args.dataset} to {path}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Catalog Facet Index
+Per-value row bitmaps for shelf, owner, year and lending status, with counts under combined filters
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def mask_to_bitmap(mask):
+    """Boolean row mask -> int bitmap (bit i set when row i matches)"""
+    return int.from_bytes(np.packbits(np.asarray(mask, dtype=bool), bitorder='little').tobytes(), 'little')
+
+
+def bitmap_to_mask(bitmap, size):
+    """int bitmap -> boolean row mask of length size"""
+    raw = np.frombuffer(bitmap.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little', count=size).astype(bool)
+
+
+class FacetIndex:
+    """
+    Facet -> value -> bitmap of the catalog rows holding that value.
+
+    Combining filters is a bitwise AND of a few bitmaps and a count is a popcount,
+    so neither touches the books themselves. Rows can be deleted and inserted in
+    place, so a few changed books do not need a rebuild.
+    """
+
+    def __init__(self, columns):
+        self._bitmaps = {}
+        self.size = 0
+        for facet, values in columns.items():
+            self.size = len(values)
+            codes, uniques = pd.factorize(values, sort=True)
+            self._bitmaps[facet] = {
+                value.item() if hasattr(value, 'item') else value: mask_to_bitmap(codes == code)
+                for code, value in enumerate(uniques)
+            }
+        self.all = (1 << self.size) - 1
+
+    def copy(self):
+        """Independent copy (bitmaps are immutable ints, so only the dicts are copied)"""
+        clone = FacetIndex({})
+        clone._bitmaps = {facet: dict(bitmaps) for facet, bitmaps in self._bitmaps.items()}
+        clone.size, clone.all = self.size, self.all
+        return clone
+
+    def delete_rows(self, positions):
+        """Drop the rows at positions (row numbers before the deletion); later rows move up"""
+        for position in sorted(positions, reverse=True):
+            low = (1 << position) - 1
+            for bitmaps in self._bitmaps.values():
+                for value, bitmap in list(bitmaps.items()):
+                    bitmap = (bitmap & low) | ((bitmap >> (position + 1)) << position)
+                    if bitmap:
+                        bitmaps[value] = bitmap
+                    else:
+                        del bitmaps[value]
+        self.size -= len(positions)
+        self.all = (1 << self.size) - 1
+
+    def insert_rows(self, positions, columns):
+        """
+        Insert rows at positions (ascending row numbers after the insertion) holding
+        columns = {facet: values}; later rows move down.
+        """
+        for i, position in enumerate(positions):
+            low = (1 << position) - 1
+            for facet, bitmaps in self._bitmaps.items():
+                for value, bitmap in bitmaps.items():
+                    bitmaps[value] = (bitmap & low) | ((bitmap >> position) << (position + 1))
+                value = columns[facet][i]
+                if not pd.isna(value):
+                    bitmaps[value] = bitmaps.get(value, 0) | (1 << position)
+        self.size += len(positions)
+        self.all = (1 << self.size) - 1
+
+    def values(self, facet):
+        """Distinct values of facet (rows with no value are not indexed)"""
+        return list(self._bitmaps[facet])
+
+    def select(self, selected, exclude=None):
+        """Bitmap of rows matching every {facet: value} in selected (None = any), skipping exclude"""
+        bitmap = self.all
+        for facet, value in selected.items():
+            if value is None or facet == exclude:
+                continue
+            bitmap &= self._bitmaps[facet].get(value, 0)
+        return bitmap
+
+    def counts(self, facet, base):
+        """value -> number of rows in base holding it"""
+        return {value: (base & bitmap).bit_count() for value, bitmap in self._bitmaps[facet].items()}
+
+    def facet_counts(self, selected, base=None):
+        """
+        Counts for every facet, each conditioned on base and the other facets' selections,
+        i.e. how many rows a dropdown option would leave if it were picked.
+        """
+        base = self.all if base is None else base
+        return {facet: self.counts(facet, base & self.select(selected, exclude=facet))
+                for facet in self._bitmaps}
@@ -1,8 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions as gcp_exceptions
 import os
 import streamlit as st
+from bisect import bisect_right
 from datetime import datetime
+from utils.collection_cache import CollectionCache
+from utils.overdue import DueDateIndex
+from utils.sequences import SequenceAllocator
+from utils.auth_utils import invalidate_access_level
 
 def initialize_firebase():
     """
@@ -43,18 +49,69 @@ def initialize_firebase():
 
     return firestore.client()
 
-# Initialize Firestore client
-db = initialize_firebase()
+# Storage backend: 'firestore' (default) or 'memory' for a local, network-free stand-in
+# that implements the same client API (see utils/memory_store.py)
+DB_BACKEND = os.environ.get('LIBRARY_DB_BACKEND', 'firestore').lower()
+
+def initialize_database():
+    """Returns the document store client for the configured backend."""
+    if DB_BACKEND == 'memory':
+        from utils.memory_store import create_memory_client
+        seed_books = int(os.environ.get('LIBRARY_MEMORY_SEED_BOOKS', '0') or 0)
+        return create_memory_client(seed_books=seed_books)
+    if DB_BACKEND != 'firestore':
+        raise ValueError(f"Unknown LIBRARY_DB_BACKEND: {DB_BACKEND}")
+    return initialize_firebase()
+
+# Initialize database client
+db = initialize_database()
+
+def _transactional(func):
+    """Wraps func(transaction, ...) with the active backend's transaction runner."""
+    if DB_BACKEND == 'memory':
+        from utils.memory_store import transactional
+        return transactional(func)
+    return firestore.transactional(func)
+
+# Numbers reserved per counter transaction (1 keeps tracking numbers gap-free;
+# raise it to cut counter writes when many books are added at once)
+TRACKING_NUMBER_BLOCK_SIZE = 1
+SHELF_ID_BLOCK_SIZE = 1
+
+@st.cache_resource
+def _sequences():
+    """Process-wide allocator for tracking numbers and shelf IDs."""
+    return SequenceAllocator(db, _transactional)
+
+# Errors after which we cannot tell whether a write was applied
+AMBIGUOUS_WRITE_ERRORS = (
+    gcp_exceptions.DeadlineExceeded,
+    gcp_exceptions.ServiceUnavailable,
+    gcp_exceptions.InternalServerError,
+    gcp_exceptions.Unknown,
+    gcp_exceptions.RetryError,
+)
+
+def _recover_cache(cache, doc_ref, error):
+    """After a failed write, re-read the document if the write may still have landed."""
+    if doc_ref is None or not isinstance(error, AMBIGUOUS_WRITE_ERRORS):
+        return
+    try:
+        cache.refresh(doc_ref)
+    except Exception as e:
+        print(f"Error refreshing cache after ambiguous write: {e}")
 
 def add_book(title, authors, publisher, edition, publish_date_str, page_count='',
              isbn='', preview_url='', bookshelf_id='', tracking_number='', owner_id=''):
     """Adds a new book to Firestore. Expects publish_date_str as a string."""
+    book_ref = None
     try:
         # Generate tracking number if not provided
         if not tracking_number:
             tracking_number = generate_tracking_number()
 
-        db.collection('books').add({
+        book_ref = db.collection('books').document()
+        book_data = {
             'title': title,
             'authors': authors,
             'publisher': publisher,
@@ -71,26 +128,138 @@ def add_book(title, authors, publisher, edition, publish_date_str, page_count=''
             'lent_date': '',
             'lent_by': '',
             'created_at': datetime.now().isoformat()
-        })
-        get_books.clear()  # Clear cache after adding
+        }
+        result = book_ref.set(book_data)
+        _books_cache().put(book_ref.id, book_data, result.update_time)
         return True, tracking_number
     except Exception as e:
+        _recover_cache(_books_cache(), book_ref, e)
         print(f"Error adding book: {e}")
         return False, None
 
-@st.cache_data(ttl=60)  # Cache for 60 seconds
+# Book fields kept in the catalog cache: what tables, search, filters, statistics and
+# lending need. The rest (preview URL, edition, page count, timestamps...) is read on demand.
+BOOK_LIST_FIELDS = ['title', 'authors', 'publisher', 'isbn', 'tracking_number', 'publish_date',
+                    'bookshelf_id', 'owner_id', 'is_lent', 'lent_to', 'active_loan_id', 'created_at']
+
+@st.cache_resource
+def _books_cache():
+    """Process-wide live cache of the books collection (one initial load, then snapshot updates)."""
+    return CollectionCache(db.collection('books'), fields=BOOK_LIST_FIELDS)
+
 def get_books():
-    """Retrieves all books from Firestore."""
+    """
+    Retrieves all books from the live catalog cache, limited to BOOK_LIST_FIELDS.
+    Use get_book()/get_books_by_ids() for full records. Treat the result as read-only.
+    """
     try:
-        books_stream = db.collection('books').stream()
-        return [{**book.to_dict(), 'id': book.id} for book in books_stream]
+        return _books_cache().records()
     except Exception as e:
         print(f"Error getting books: {e}")
         return []
 
+def _read_books(book_ids):
+    refs = [db.collection('books').document(book_id) for book_id in book_ids]
+    return {doc.id: {**doc.to_dict(), 'id': doc.id} for doc in db.get_all(refs) if doc.exists}
+
+@st.cache_data(max_entries=200, show_spinner=False)
+def _fetch_books(stamped_ids):
+    # Keyed by (book ID, update time) pairs, so any write to one of the books misses the cache
+    return _read_books([book_id for book_id, _ in stamped_ids])
+
+def get_books_by_ids(book_ids):
+    """Full book records for book_ids (one batched read for those not cached), in the same order."""
+    try:
+        cache = _books_cache()
+        stamped_ids, unstamped_ids = [], []
+        for book_id in book_ids:
+            update_time = cache.update_time(book_id)
+            if update_time is None:
+                # Not (yet) in the live cache: nothing would invalidate a cached copy, so read it fresh
+                unstamped_ids.append(book_id)
+            else:
+                stamped_ids.append((book_id, str(update_time)))
+        books = _fetch_books(tuple(stamped_ids)) if stamped_ids else {}
+        if unstamped_ids:
+            books = {**books, **_read_books(unstamped_ids)}
+        return [books[book_id] for book_id in book_ids if book_id in books]
+    except Exception as e:
+        print(f"Error getting books by ID: {e}")
+        return []
+
+def get_book(book_id):
+    """Full record of one book, or None."""
+    books = get_books_by_ids([book_id])
+    return books[0] if books else None
+
+def get_books_version():
+    """Returns the catalog version; it changes whenever any book is added, edited or removed."""
+    return _books_cache().version
+
+def get_books_snapshot():
+    """Returns (version, books) as one consistent pair."""
+    return _books_cache().snapshot()
+
+def get_books_changes(since_version):
+    """
+    Returns (version, changed) where changed maps each book ID modified after
+    since_version to its current record (None if deleted), or is None when
+    derived data must be rebuilt from get_books_snapshot().
+    """
+    return _books_cache().changes_since(since_version)
+
+# Books per page on the View Books and Manage Books pages
+BOOKS_PAGE_SIZE = 50
+
+def warm_books_cache():
+    """Starts loading the books cache in the background if needed. Returns True once it is ready."""
+    try:
+        return _books_cache().warm()
+    except Exception as e:
+        print(f"Error loading books cache: {e}")
+        return False
+
+def _title_order_key(book):
+    return (book.get('title') or '', book['id'])
+
+def _title_ordered(books):
+    ordered = sorted(books, key=_title_order_key)
+    return ordered, [_title_order_key(book) for book in ordered]
+
+def get_books_page(page_size=BOOKS_PAGE_SIZE, cursor=None):
+    """
+    Returns (books, next_cursor): one page of books ordered by title, starting after
+    cursor (None for the first page). next_cursor is None on the last page.
+
+    Served from the books cache once it has loaded; before that (a cold process)
+    the page is one ordered query reading page_size + 1 documents, not the collection.
+    """
+    try:
+        cache = _books_cache()
+        if cache.warm():
+            ordered, keys = cache.view('by_title', _title_ordered)
+            start = 0 if cursor is None else bisect_right(keys, tuple(cursor))
+            books = ordered[start:start + page_size + 1]
+        else:
+            # Title then document ID, so books sharing a title never straddle a page boundary
+            query = (db.collection('books').select(BOOK_LIST_FIELDS)
+                     .order_by('title').order_by('__name__').limit(page_size + 1))
+            if cursor is not None:
+                query = query.start_after({'title': cursor[0], '__name__': cursor[1]})
+            books = [{**doc.to_dict(), 'id': doc.id} for doc in query.stream()]
+
+        if len(books) > page_size:
+            books = books[:page_size]
+            return books, _title_order_key(books[-1])
+        return books, None
+    except Exception as e:
+        print(f"Error getting books page: {e}")
+        return [], None
+
 def edit_book(book_id, title, authors, publisher, edition, publish_date_str, page_count='',
               isbn='', preview_url='', bookshelf_id='', tracking_number='', owner_id=''):
     """Updates an existing book. Expects publish_date_str as a string."""
+    book_ref = db.collection('books').document(book_id)
     try:
         update_data = {
             'title': title,
@@ -109,296 +278,660 @@ def edit_book(book_id, title, authors, publisher, edition, publish_date_str, pag
         if tracking_number:
             update_data['tracking_number'] = tracking_number
 
-        db.collection('books').document(book_id).update(update_data)
-        get_books.clear()  # Clear cache after editing
+        result = book_ref.update(update_data)
+        _books_cache().patch(book_id, update_data, result.update_time)
         return True
     except Exception as e:
+        _recover_cache(_books_cache(), book_ref, e)
         print(f"Error updating book: {e}")
         return False
 
+# Firestore accepts at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+def update_books(updates):
+    """
+    Applies {book_id: fields} updates in batched writes of up to MAX_BATCH_WRITES.
+    Returns the IDs of the books whose batch committed.
+    """
+    updated = []
+    items = list(updates.items())
+    for start in range(0, len(items), MAX_BATCH_WRITES):
+        chunk = items[start:start + MAX_BATCH_WRITES]
+        batch = db.batch()
+        for book_id, fields in chunk:
+            batch.update(db.collection('books').document(book_id), fields)
+        try:
+            results = batch.commit()
+        except Exception as e:
+            for book_id, _ in chunk:
+                _recover_cache(_books_cache(), db.collection('books').document(book_id), e)
+            print(f"Error updating books batch: {e}")
+            continue
+        for (book_id, fields), result in zip(chunk, results):
+            _books_cache().patch(book_id, fields, result.update_time)
+        updated.extend(book_id for book_id, _ in chunk)
+    return updated
+
 def delete_book(book_id):
     """Deletes a book from Firestore by its ID."""
+    book_ref = db.collection('books').document(book_id)
     try:
-        db.collection('books').document(book_id).delete()
-        get_books.clear()  # Clear cache after deleting
+        delete_time = book_ref.delete()
+        _books_cache().discard(book_id, delete_time)
         return True
     except Exception as e:
+        _recover_cache(_books_cache(), book_ref, e)
         print(f"Error deleting book: {e}")
         return False
 
 # Bookshelf Management Functions
 def add_bookshelf(title, description=''):
     """Adds a new bookshelf to Firestore."""
+    shelf_ref = None
     try:
-        # Get current max ID to generate next ID
-        shelves = db.collection('bookshelves').stream()
-        max_id = 0
-        for shelf in shelves:
-            shelf_data = shelf.to_dict()
-            if shelf_data.get('shelf_id', 0) > max_id:
-                max_id = shelf_data['shelf_id']
-
-        new_id = max_id + 1
+        new_id = _sequences().allocate('shelf_id', SHELF_ID_BLOCK_SIZE, seed=_max_shelf_id)
 
-        db.collection('bookshelves').add({
+        shelf_ref = db.collection('bookshelves').document()
+        shelf_data = {
             'shelf_id': new_id,
             'title': title,
             'description': description
-        })
-        get_bookshelves.clear()  # Clear cache after adding
+        }
+        result = shelf_ref.set(shelf_data)
+        _bookshelves_cache().put(shelf_ref.id, shelf_data, result.update_time)
         return True, new_id
     except Exception as e:
+        _recover_cache(_bookshelves_cache(), shelf_ref, e)
         print(f"Error adding bookshelf: {e}")
         return False, None
 
-@st.cache_data(ttl=60)  # Cache for 60 seconds
+def _max_shelf_id():
+    """Highest shelf_id in use; seeds the shelf_id counter the first time it is used."""
+    return max((shelf.get('shelf_id', 0) for shelf in get_bookshelves()), default=0)
+
+@st.cache_resource
+def _bookshelves_cache():
+    """Process-wide live cache of the bookshelves collection."""
+    return CollectionCache(db.collection('bookshelves'))
+
 def get_bookshelves():
-    """Retrieves all bookshelves from Firestore."""
+    """Retrieves all bookshelves from the live cache. Treat the result as read-only."""
     try:
-        shelves_stream = db.collection('bookshelves').stream()
-        return [{**shelf.to_dict(), 'id': shelf.id} for shelf in shelves_stream]
+        return _bookshelves_cache().records()
     except Exception as e:
         print(f"Error getting bookshelves: {e}")
         return []
 
+def get_bookshelves_version():
+    """Returns the bookshelves version; it changes whenever a shelf is added, edited or removed."""
+    return _bookshelves_cache().version
+
 def edit_bookshelf(doc_id, title, description=''):
     """Updates an existing bookshelf."""
+    shelf_ref = db.collection('bookshelves').document(doc_id)
     try:
-        db.collection('bookshelves').document(doc_id).update({
+        update_data = {
             'title': title,
             'description': description
-        })
-        get_bookshelves.clear()  # Clear cache after editing
+        }
+        result = shelf_ref.update(update_data)
+        _bookshelves_cache().patch(doc_id, update_data, result.update_time)
         return True
     except Exception as e:
+        _recover_cache(_bookshelves_cache(), shelf_ref, e)
         print(f"Error updating bookshelf: {e}")
         return False
 
 def delete_bookshelf(doc_id):
     """Deletes a bookshelf from Firestore by its document ID."""
+    shelf_ref = db.collection('bookshelves').document(doc_id)
     try:
-        db.collection('bookshelves').document(doc_id).delete()
-        get_bookshelves.clear()  # Clear cache after deleting
+        delete_time = shelf_ref.delete()
+        _bookshelves_cache().discard(doc_id, delete_time)
         return True
     except Exception as e:
+        _recover_cache(_bookshelves_cache(), shelf_ref, e)
         print(f"Error deleting bookshelf: {e}")
         return False
 
 def generate_tracking_number():
-    """Generates a unique tracking number for a book (format: BK-YYYYMMDD-NNNN)."""
+    """Allocates a unique tracking number for a book (format: BK-YYYYMMDD-NNNN)."""
     from datetime import datetime
 
     try:
-        # Get current date
         date_str = datetime.now().strftime("%Y%m%d")
-
-        # Get all books with tracking numbers from today
-        books = db.collection('books').where('tracking_number', '>=', f'BK-{date_str}-0000').stream()
-
-        max_seq = 0
-        for book in books:
-            book_data = book.to_dict()
-            tracking = book_data.get('tracking_number', '')
-            if tracking.startswith(f'BK-{date_str}-'):
-                try:
-                    seq = int(tracking.split('-')[-1])
-                    if seq > max_seq:
-                        max_seq = seq
-                except:
-                    pass
-
-        new_seq = max_seq + 1
-        return f'BK-{date_str}-{new_seq:04d}'
+        seq = _sequences().allocate(f'tracking-{date_str}', TRACKING_NUMBER_BLOCK_SIZE,
+                                    seed=lambda: _max_tracking_sequence(date_str))
+        _tracking_preview.clear()  # The previewed number is now taken
+        return f'BK-{date_str}-{seq:04d}'
     except Exception as e:
         print(f"Error generating tracking number: {e}")
         # Fallback to timestamp-based tracking number
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         return f'BK-{timestamp}'
 
+def preview_tracking_number():
+    """Returns the tracking number the next book will most likely get, without allocating it."""
+    from datetime import datetime
+
+    date_str = datetime.now().strftime("%Y%m%d")
+    try:
+        return _tracking_preview(date_str)
+    except Exception as e:
+        print(f"Error previewing tracking number: {e}")
+        return f'BK-{date_str}-????'
+
+@st.cache_data  # Keyed by date; cleared whenever a number is allocated
+def _tracking_preview(date_str):
+    """Peeks at the day's counter once, so form reruns cost no Firestore reads."""
+    seq = _sequences().peek(f'tracking-{date_str}', seed=lambda: _max_tracking_sequence(date_str))
+    return f'BK-{date_str}-{seq:04d}'
+
+def _max_tracking_sequence(date_str):
+    """Highest sequence already used on date_str; seeds that day's counter the first time."""
+    books = (db.collection('books')
+             .where('tracking_number', '>=', f'BK-{date_str}-0000')
+             .where('tracking_number', '<=', f'BK-{date_str}-9999')
+             .stream())
+
+    max_seq = 0
+    for book in books:
+        try:
+            max_seq = max(max_seq, int(book.to_dict().get('tracking_number', '').split('-')[-1]))
+        except ValueError:
+            pass
+    return max_seq
+
 # Owner Management Functions
 def add_owner(owner_id, name, email='', cell_phone=''):
     """Adds a new owner to Firestore. Owner ID must be 3 digits."""
+    owner_ref = None
     try:
         # Validate owner_id is 3 digits
         if not owner_id or len(str(owner_id)) != 3 or not str(owner_id).isdigit():
             return False, "Owner ID must be exactly 3 digits"
 
         # Check if owner_id already exists
-        existing = db.collection('owners').where('owner_id', '==', owner_id).stream()
-        if any(existing):
+        if any(owner.get('owner_id') == owner_id for owner in get_owners()):
             return False, f"Owner ID {owner_id} already exists"
 
-        db.collection('owners').add({
+        owner_ref = db.collection('owners').document()
+        owner_data = {
             'owner_id': owner_id,
             'name': name,
             'email': email,
             'cell_phone': cell_phone
-        })
-        get_owners.clear()  # Clear cache after adding
+        }
+        result = owner_ref.set(owner_data)
+        _owners_cache().put(owner_ref.id, owner_data, result.update_time)
         return True, "Success"
     except Exception as e:
+        _recover_cache(_owners_cache(), owner_ref, e)
         print(f"Error adding owner: {e}")
         return False, str(e)
 
-@st.cache_data(ttl=60)  # Cache for 60 seconds
+@st.cache_resource
+def _owners_cache():
+    """Process-wide live cache of the owners collection."""
+    return CollectionCache(db.collection('owners'))
+
 def get_owners():
-    """Retrieves all owners from Firestore."""
+    """Retrieves all owners from the live cache. Treat the result as read-only."""
     try:
-        owners_stream = db.collection('owners').stream()
-        return [{**owner.to_dict(), 'id': owner.id} for owner in owners_stream]
+        return _owners_cache().records()
     except Exception as e:
         print(f"Error getting owners: {e}")
         return []
 
+def get_owners_version():
+    """Returns the owners version; it changes whenever an owner is added, edited or removed."""
+    return _owners_cache().version
+
 def edit_owner(doc_id, name, email='', cell_phone=''):
     """Updates an existing owner. Cannot change owner_id."""
+    owner_ref = db.collection('owners').document(doc_id)
     try:
-        db.collection('owners').document(doc_id).update({
+        update_data = {
             'name': name,
             'email': email,
             'cell_phone': cell_phone
-        })
-        get_owners.clear()  # Clear cache after editing
+        }
+        result = owner_ref.update(update_data)
+        _owners_cache().patch(doc_id, update_data, result.update_time)
         return True
     except Exception as e:
+        _recover_cache(_owners_cache(), owner_ref, e)
         print(f"Error updating owner: {e}")
         return False
 
 def delete_owner(doc_id):
     """Deletes an owner from Firestore by its document ID."""
+    owner_ref = db.collection('owners').document(doc_id)
     try:
-        db.collection('owners').document(doc_id).delete()
-        get_owners.clear()  # Clear cache after deleting
+        delete_time = owner_ref.delete()
+        _owners_cache().discard(doc_id, delete_time)
         return True
     except Exception as e:
+        _recover_cache(_owners_cache(), owner_ref, e)
         print(f"Error deleting owner: {e}")
         return False
 
 # User Management Functions
+@st.cache_resource
+def _users_cache():
+    """Process-wide live cache of the users collection."""
+    return CollectionCache(db.collection('users'))
+
 def get_all_users():
-    """Retrieves all users from Firestore"""
+    """Retrieves all users from the live cache. Treat the result as read-only."""
     try:
-        users_stream = db.collection('users').stream()
-        return [{**user.to_dict(), 'id': user.id} for user in users_stream]
+        return _users_cache().records()
     except Exception as e:
         print(f"Error getting users: {e}")
         return []
 
+def _invalidate_user_access(user_id):
+    """Push an access change into the access-level cache so it applies on the next rerun."""
+    # User documents are keyed by email; legacy auto-ID documents can't be mapped cheaply
+    invalidate_access_level(user_id if '@' in user_id else None)
+
 def update_user_access(user_id, access_level, approved_by):
     """Update user's access level"""
     from datetime import datetime
+    user_ref = db.collection('users').document(user_id)
     try:
-        db.collection('users').document(user_id).update({
+        update_data = {
             'access_level': access_level,
             'approved_by': approved_by,
             'approved_at': datetime.now().isoformat()
-        })
+        }
+        result = user_ref.update(update_data)
+        _users_cache().patch(user_id, update_data, result.update_time)
+        _invalidate_user_access(user_id)
         return True
     except Exception as e:
+        _recover_cache(_users_cache(), user_ref, e)
         print(f"Error updating user access: {e}")
         return False
 
 
 def delete_user(user_id):
     """Delete a user from Firestore"""
+    user_ref = db.collection('users').document(user_id)
     try:
-        db.collection('users').document(user_id).delete()
+        delete_time = user_ref.delete()
+        _users_cache().discard(user_id, delete_time)
+        _invalidate_user_access(user_id)
         return True
     except Exception as e:
+        _recover_cache(_users_cache(), user_ref, e)
         print(f"Error deleting user: {e}")
         return False
+
 # Book Lending Functions
+@st.cache_resource
+def _loans_cache():
+    """
+    Process-wide live cache of the active loans (returned == False). Returned loans
+    drop out of it; loan history is queried page by page (get_loan_history_page).
+    """
+    return CollectionCache(db.collection('book_loans').where('returned', '==', False))
+
+# Attempts at lending a book whose document changed between read and commit
+LEND_ATTEMPTS = 3
+
+def _read_book_for_write(book_id, fresh):
+    """(book data, update time) from the live cache, or from one document read if fresh or unknown"""
+    if not fresh:
+        update_time = _books_cache().update_time(book_id)
+        book_data = _books_cache().get(book_id)
+        if update_time is not None or book_data is None:
+            return book_data, update_time
+    snapshot = db.collection('books').document(book_id).get()
+    return (snapshot.to_dict() if snapshot.exists else None), snapshot.update_time
+
+def _write_chunks(items, writes_per_item):
+    """Splits items into runs needing at most MAX_BATCH_WRITES writes each (an item is never split)"""
+    chunk, size = [], 0
+    for item in items:
+        count = writes_per_item(item)
+        if chunk and size + count > MAX_BATCH_WRITES:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += count
+    if chunk:
+        yield chunk
+
+def _lend_records(book_id, book_data, loan_id, borrower_email, borrower_name, lender_email, due_date, current_date):
+    """(book fields, loan record) for lending book_id under loan_id"""
+    lent_fields = {
+        'is_lent': True,
+        'lent_to': borrower_email,
+        'lent_date': current_date,
+        'lent_by': lender_email,
+        'active_loan_id': loan_id
+    }
+    loan_data = {
+        'book_id': book_id,
+        'tracking_number': book_data.get('tracking_number', ''),
+        'book_title': book_data.get('title', ''),
+        'borrowed_by_email': borrower_email,
+        'borrowed_by_name': borrower_name,
+        'borrowed_date': current_date,
+        'due_date': due_date,
+        'returned': False,
+        'returned_date': None,
+        'approved_by': lender_email
+    }
+    return lent_fields, loan_data
+
 def lend_book(book_id, borrower_email, borrower_name, lender_email, due_date):
-    """Lend a book to a user"""
+    """
+    Lend a book to a user.
+
+    Marking the book lent and creating the loan record is one batched commit,
+    conditional on the book not having changed since it was checked: if another
+    lend got there first, the commit is rejected and the book is re-read, so a
+    copy can never be lent twice. The loan ID is allocated client-side and kept
+    on the book as active_loan_id.
+    """
     from datetime import datetime
+    book_ref = db.collection('books').document(book_id)
+    loan_ref = db.collection('book_loans').document()
     try:
         current_date = datetime.now().strftime("%Y-%m-%d")
-
-        # Get book details
-        book = db.collection('books').document(book_id).get()
-        if not book.exists:
-            return False, "Book not found"
-
-        book_data = book.to_dict()
-
-        # Check if already lent
-        if book_data.get('is_lent', False):
-            return False, "Book is already lent out"
-
-        # Update book status
-        db.collection('books').document(book_id).update({
-            'is_lent': True,
-            'lent_to': borrower_email,
-            'lent_date': current_date,
-            'lent_by': lender_email
-        })
-
-        # Create loan record
-        db.collection('book_loans').add({
-            'book_id': book_id,
-            'tracking_number': book_data.get('tracking_number', ''),
-            'book_title': book_data.get('title', ''),
-            'borrowed_by_email': borrower_email,
-            'borrowed_by_name': borrower_name,
-            'borrowed_date': current_date,
-            'due_date': due_date,
-            'returned': False,
-            'returned_date': None,
-            'approved_by': lender_email
-        })
-
-        get_books.clear()  # Clear cache after lending
-        return True, "Book lent successfully"
+        for attempt in range(LEND_ATTEMPTS):
+            # First attempt checks the live cache (no document read)
+            book_data, update_time = _read_book_for_write(book_id, fresh=attempt > 0)
+            if book_data is None:
+                return False, "Book not found"
+
+            # Check if already lent
+            if book_data.get('is_lent', False):
+                return False, "Book is already lent out"
+
+            lent_fields, loan_data = _lend_records(book_id, book_data, loan_ref.id, borrower_email,
+                                                   borrower_name, lender_email, due_date, current_date)
+            batch = db.batch()
+            batch.update(book_ref, lent_fields, option=db.write_option(last_update_time=update_time))
+            batch.create(loan_ref, loan_data)
+            try:
+                book_result, loan_result = batch.commit()
+            except gcp_exceptions.FailedPrecondition:
+                continue  # the book changed since it was read - check it again
+            _books_cache().patch(book_id, lent_fields, book_result.update_time)
+            _loans_cache().put(loan_ref.id, loan_data, loan_result.update_time)
+            return True, "Book lent successfully"
+        return False, "Book is being changed by someone else, please try again"
     except Exception as e:
+        _recover_cache(_books_cache(), book_ref, e)
+        _recover_cache(_loans_cache(), loan_ref, e)
         print(f"Error lending book: {e}")
         return False, str(e)
 
+def lend_books(book_ids, borrower_email, borrower_name, lender_email, due_date):
+    """
+    Lend several books to one user in batched commits of up to MAX_BATCH_WRITES writes
+    (two per book). Book writes are conditional as in lend_book; when a batch is
+    rejected because one of its books changed, that batch's books are lent one by one.
+    Returns {book_id: (success, message)}.
+    """
+    from datetime import datetime
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    results = {}
+    plans = []
+    for book_id in dict.fromkeys(book_ids):
+        try:
+            book_data, update_time = _read_book_for_write(book_id, fresh=False)
+        except Exception as e:
+            results[book_id] = (False, str(e))
+            continue
+        if book_data is None:
+            results[book_id] = (False, "Book not found")
+        elif book_data.get('is_lent', False):
+            results[book_id] = (False, "Book is already lent out")
+        else:
+            plans.append((book_id, book_data, update_time, db.collection('book_loans').document()))
+
+    for chunk in _write_chunks(plans, lambda plan: 2):
+        batch = db.batch()
+        records = []
+        for book_id, book_data, update_time, loan_ref in chunk:
+            lent_fields, loan_data = _lend_records(book_id, book_data, loan_ref.id, borrower_email,
+                                                   borrower_name, lender_email, due_date, current_date)
+            batch.update(db.collection('books').document(book_id), lent_fields,
+                         option=db.write_option(last_update_time=update_time))
+            batch.create(loan_ref, loan_data)
+            records.append((book_id, loan_ref, lent_fields, loan_data))
+        try:
+            write_results = batch.commit()
+        except gcp_exceptions.FailedPrecondition:
+            # A book changed since it was read - re-check this batch's books individually
+            for book_id, *_ in chunk:
+                results[book_id] = lend_book(book_id, borrower_email, borrower_name, lender_email, due_date)
+            continue
+        except Exception as e:
+            for book_id, _, _, loan_ref in chunk:
+                _recover_cache(_books_cache(), db.collection('books').document(book_id), e)
+                _recover_cache(_loans_cache(), loan_ref, e)
+                results[book_id] = (False, str(e))
+            print(f"Error lending books batch: {e}")
+            continue
+        for (book_id, loan_ref, lent_fields, loan_data), book_result, loan_result in zip(
+                records, write_results[0::2], write_results[1::2]):
+            _books_cache().patch(book_id, lent_fields, book_result.update_time)
+            _loans_cache().put(loan_ref.id, loan_data, loan_result.update_time)
+            results[book_id] = (True, "Book lent successfully")
+    return results
+
+# Book fields written when a book comes back
+RETURNED_FIELDS = {
+    'is_lent': False,
+    'lent_to': '',
+    'lent_date': '',
+    'lent_by': '',
+    'active_loan_id': ''
+}
+
+def _legacy_loan_ids():
+    """book_id -> active loan IDs, for books lent before active_loan_id existed"""
+    loan_ids = {}
+    for loan in get_active_loans():
+        loan_ids.setdefault(loan.get('book_id'), []).append(loan['id'])
+    return loan_ids
+
+def _return_plan(book_id, book_data, legacy_loans):
+    """(loan IDs the return closes, None) or (None, reason the book cannot be returned)"""
+    if book_data is None:
+        return None, "Book not found"
+    if not book_data.get('is_lent', False):
+        return None, "Book is not lent out"
+    if book_data.get('active_loan_id'):
+        return [book_data['active_loan_id']], None
+    return legacy_loans().get(book_id, []), None
+
+def _add_return_writes(batch, book_id, update_time, loan_ids, returned_date):
+    # The book write is conditional like lend's, so a stale active_loan_id/is_lent is rejected
+    batch.update(db.collection('books').document(book_id), RETURNED_FIELDS,
+                 option=db.write_option(last_update_time=update_time))
+    for loan_id in loan_ids:
+        batch.update(db.collection('book_loans').document(loan_id),
+                     {'returned': True, 'returned_date': returned_date})
+
+def _apply_return(book_id, loan_ids, write_results):
+    """Write-through after a committed return; write_results yields the book's, then each loan's"""
+    _books_cache().patch(book_id, RETURNED_FIELDS, next(write_results).update_time)
+    for loan_id in loan_ids:
+        # A returned loan leaves the active-loans query
+        _loans_cache().discard(loan_id, next(write_results).update_time)
+
 def return_book(book_id):
-    """Mark a book as returned"""
+    """
+    Mark a book as returned.
+
+    The book and its loan record are updated in one batched commit, conditional
+    on the book not having changed since it was checked (as in lend_book): if
+    another return or lend got there first, the book is re-read and checked
+    again, so a book is never returned twice and a stale active_loan_id never
+    closes the wrong loan. Books lent before active_loan_id existed fall back
+    to the cached active loans.
+    """
     from datetime import datetime
+    book_ref = db.collection('books').document(book_id)
+    loan_ids = []
     try:
         current_date = datetime.now().strftime("%Y-%m-%d")
-
-        # Update book status
-        db.collection('books').document(book_id).update({
-            'is_lent': False,
-            'lent_to': '',
-            'lent_date': '',
-            'lent_by': ''
-        })
-
-        # Update loan record
-        loans = db.collection('book_loans').where('book_id', '==', book_id).where('returned', '==', False).stream()
-        for loan in loans:
-            db.collection('book_loans').document(loan.id).update({
-                'returned': True,
-                'returned_date': current_date
-            })
-
-        get_books.clear()  # Clear cache after returning
-        return True, "Book returned successfully"
+        for attempt in range(LEND_ATTEMPTS):
+            # First attempt checks the live cache (no document read)
+            book_data, update_time = _read_book_for_write(book_id, fresh=attempt > 0)
+            loan_ids, error = _return_plan(book_id, book_data, _legacy_loan_ids)
+            if error:
+                return False, error
+            batch = db.batch()
+            _add_return_writes(batch, book_id, update_time, loan_ids, current_date)
+            try:
+                write_results = batch.commit()
+            except gcp_exceptions.FailedPrecondition:
+                continue  # the book changed since it was read - check it again
+            _apply_return(book_id, loan_ids, iter(write_results))
+            return True, "Book returned successfully"
+        return False, "Book is being changed by someone else, please try again"
     except Exception as e:
+        _recover_cache(_books_cache(), book_ref, e)
+        for loan_id in loan_ids:
+            _recover_cache(_loans_cache(), db.collection('book_loans').document(loan_id), e)
         print(f"Error returning book: {e}")
         return False, str(e)
 
+def return_books(book_ids):
+    """
+    Mark several books as returned in batched commits of up to MAX_BATCH_WRITES writes;
+    a book and its loan record(s) always share a commit. Book writes are conditional
+    as in return_book; when a batch is rejected because one of its books changed,
+    that batch's books are returned one by one. Returns {book_id: (success, message)}.
+    """
+    from datetime import datetime
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    results = {}
+    plans = []
+    legacy_loans = None
+
+    def cached_legacy_loans():
+        nonlocal legacy_loans
+        if legacy_loans is None:
+            legacy_loans = _legacy_loan_ids()
+        return legacy_loans
+
+    for book_id in dict.fromkeys(book_ids):
+        try:
+            book_data, update_time = _read_book_for_write(book_id, fresh=False)
+            loan_ids, error = _return_plan(book_id, book_data, cached_legacy_loans)
+        except Exception as e:
+            results[book_id] = (False, str(e))
+            continue
+        if error:
+            results[book_id] = (False, error)
+        else:
+            plans.append((book_id, update_time, loan_ids))
+
+    for chunk in _write_chunks(plans, lambda plan: 1 + len(plan[2])):
+        batch = db.batch()
+        for book_id, update_time, loan_ids in chunk:
+            _add_return_writes(batch, book_id, update_time, loan_ids, current_date)
+        try:
+            write_results = iter(batch.commit())
+        except gcp_exceptions.FailedPrecondition:
+            # A book changed since it was read - re-check this batch's books individually
+            for book_id, *_ in chunk:
+                results[book_id] = return_book(book_id)
+            continue
+        except Exception as e:
+            for book_id, _, loan_ids in chunk:
+                _recover_cache(_books_cache(), db.collection('books').document(book_id), e)
+                for loan_id in loan_ids:
+                    _recover_cache(_loans_cache(), db.collection('book_loans').document(loan_id), e)
+                results[book_id] = (False, str(e))
+            print(f"Error returning books batch: {e}")
+            continue
+        for book_id, _, loan_ids in chunk:
+            _apply_return(book_id, loan_ids, write_results)
+            results[book_id] = (True, "Book returned successfully")
+    return results
+
 def get_active_loans():
-    """Get all active book loans"""
+    """Get all active book loans (derived from the live loans cache)"""
     try:
-        loans_stream = db.collection('book_loans').where('returned', '==', False).stream()
-        return [{**loan.to_dict(), 'id': loan.id} for loan in loans_stream]
+        return _loans_cache().view('active', lambda loans: [l for l in loans if not l.get('returned', False)])
     except Exception as e:
         print(f"Error getting active loans: {e}")
         return []
 
-def get_loan_history(email=None):
-    """Get loan history, optionally filtered by user email"""
+def get_due_index(due_before=None):
+    """
+    Active loans ordered by due date (a DueDateIndex), rebuilt only when loans change.
+
+    Until the loans cache has loaded, and if due_before ('YYYY-MM-DD') is given, only
+    loans due before it are read, by a range query on due_date (composite index on
+    returned + due_date, see firestore.indexes.json); the index then has complete=False.
+    """
     try:
-        if email:
-            loans_stream = db.collection('book_loans').where('borrowed_by_email', '==', email).stream()
-        else:
-            loans_stream = db.collection('book_loans').stream()
+        cache = _loans_cache()
+        if due_before is None or cache.ready:
+            return cache.view('due_index',
+                              lambda loans: DueDateIndex(l for l in loans if not l.get('returned', False)))
+        cache.warm()
+        query = (db.collection('book_loans')
+                 .where('returned', '==', False)
+                 .where('due_date', '<', due_before)
+                 .order_by('due_date'))
+        return DueDateIndex(({**doc.to_dict(), 'id': doc.id} for doc in query.stream()), complete=False)
+    except Exception as e:
+        print(f"Error getting loans by due date: {e}")
+        return DueDateIndex([], complete=False)
+
+def get_overdue_loans(today=None):
+    """Active loans due before today ('YYYY-MM-DD', default: today), most overdue first"""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    return get_due_index(due_before=today).overdue(today)
+
+# Loan history rows per page
+LOANS_PAGE_SIZE = 50
 
-        return [{**loan.to_dict(), 'id': loan.id} for loan in loans_stream]
+def get_loan_history_page(email=None, status=None, borrowed_from=None, borrowed_to=None,
+                          page_size=LOANS_PAGE_SIZE, cursor=None):
+    """
+    Returns (loans, next_cursor): one page of loan history, newest borrowed first,
+    starting after cursor (None for the first page; next_cursor is None on the last).
+
+    Filters are part of the query, so only page_size + 1 documents are read however
+    long the history is: borrower email, status ('active' or 'returned') and an
+    inclusive borrowed_date range ('YYYY-MM-DD'). Combined filters use the composite
+    indexes in firestore.indexes.json.
+    """
+    try:
+        query = db.collection('book_loans')
+        if email:
+            query = query.where('borrowed_by_email', '==', email)
+        if status in ('active', 'returned'):
+            query = query.where('returned', '==', status == 'returned')
+        if borrowed_from:
+            query = query.where('borrowed_date', '>=', borrowed_from)
+        if borrowed_to:
+            query = query.where('borrowed_date', '<=', borrowed_to)
+        # Then document ID, so loans borrowed on the same day never straddle a page boundary
+        query = (query.order_by('borrowed_date', direction=firestore.Query.DESCENDING)
+                 .order_by('__name__', direction=firestore.Query.DESCENDING)
+                 .limit(page_size + 1))
+        if cursor is not None:
+            query = query.start_after({'borrowed_date': cursor[0], '__name__': cursor[1]})
+        loans = [{**doc.to_dict(), 'id': doc.id} for doc in query.stream()]
+
+        if len(loans) > page_size:
+            loans = loans[:page_size]
+            return loans, (loans[-1].get('borrowed_date'), loans[-1]['id'])
+        return loans, None
     except Exception as e:
         print(f"Error getting loan history: {e}")
-        return []
+        return [], None
@@ -0,0 +1,89 @@
+"""
+Lookup Cache
+Persistent SQLite cache for external lookups with TTL expiry, LRU eviction and negative entries
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class LookupCache:
+    """
+    Key -> JSON value store on disk that survives app restarts.
+
+    A value of None records a negative answer ("not found") and can be given a
+    shorter TTL than positive answers. When more than max_entries are stored,
+    the least recently read entries are evicted.
+    """
+
+    def __init__(self, path, max_entries=5000, ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lookups ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT,"            # JSON; NULL for a negative entry
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lookups_accessed ON lookups (accessed_at)")
+
+    def get(self, key):
+        """Returns (found, value); value is None for a cached negative answer"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM lookups WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM lookups WHERE key = ?", (key,))
+                self._stats['misses'] += 1
+                return False, None
+            self._conn.execute("UPDATE lookups SET accessed_at = ? WHERE key = ?", (now, key))
+            self._stats['hits'] += 1
+            if row[0] is None:
+                self._stats['negative_hits'] += 1
+                return True, None
+            return True, json.loads(row[0])
+
+    def put(self, key, value):
+        """Stores value (None = negative answer) and evicts least recently used entries over the limit"""
+        now = time.time()
+        ttl = self.negative_ttl if value is None else self.ttl
+        encoded = None if value is None else json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lookups (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, encoded, now + ttl, now))
+            excess = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM lookups WHERE key IN"
+                    " (SELECT key FROM lookups ORDER BY accessed_at LIMIT ?)", (excess,))
+                self._stats['evictions'] += excess
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            self._conn.execute("DELETE FROM lookups")
+
+    def stats(self):
+        """Hit/miss counters for this process plus the number of stored entries"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+            stats = dict(self._stats, size=size)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
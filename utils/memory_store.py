@@ -0,0 +1,595 @@
+"""
+In-Memory Firestore Stand-in
+Implements the subset of the Firestore client API used by the app, so the app can be
+profiled and load-tested on a laptop without a Firebase project or network access.
+
+Select it with the environment variable LIBRARY_DB_BACKEND=memory
+(see utils/firebase_db.py). Data lives only for the lifetime of the process.
+"""
+
+import copy
+import functools
+import random
+import string
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from google.api_core import exceptions as gcp_exceptions
+
+DOCUMENT_ID = '__name__'
+
+
+def _copy(data):
+    """Copy a document, deep-copying only nested containers (cheap for flat records)"""
+    return {k: copy.deepcopy(v) if isinstance(v, (dict, list)) else v for k, v in data.items()}
+
+
+def _type_rank(value):
+    # Firestore orders values of different types by type first
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, (list, tuple)):
+        return 9
+    return 10
+
+
+def _compare(a, b):
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a in (0, 10):
+        return 0
+    return (a > b) - (a < b)
+
+
+def _sort_key(value):
+    """Key equivalent to _compare, for key-based sorting"""
+    rank = _type_rank(value)
+    return (rank, 0) if rank in (0, 10) else (rank, value)
+
+
+_MISSING = object()
+
+
+def _field(doc_id, data, field_path):
+    if field_path == DOCUMENT_ID:
+        return doc_id
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches(doc_id, data, field_path, op, expected):
+    value = _field(doc_id, data, field_path)
+    if op == '!=':
+        return value is not _MISSING and value is not None and _compare(value, expected) != 0
+    if op == 'not-in':
+        return value is not _MISSING and value is not None and all(_compare(value, e) != 0 for e in expected)
+    if value is _MISSING:
+        return False
+    if op == '==':
+        return _compare(value, expected) == 0
+    if op in ('<', '<=', '>', '>='):
+        if _type_rank(value) != _type_rank(expected):
+            return False
+        result = _compare(value, expected)
+        return {'<': result < 0, '<=': result <= 0, '>': result > 0, '>=': result >= 0}[op]
+    if op == 'in':
+        return any(_compare(value, e) == 0 for e in expected)
+    if op == 'array_contains':
+        return isinstance(value, list) and any(_compare(v, expected) == 0 for v in value)
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(_compare(v, e) == 0 for v in value for e in expected)
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    def to_dict(self):
+        return None if self._data is None else _copy(self._data)
+
+    def get(self, field_path):
+        value = _field(self.id, self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.parent = MemoryCollectionReference(client, collection_name)
+        self.path = f"{collection_name}/{doc_id}"
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._get(self, field_paths)
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge)])[0]
+
+    def create(self, document_data):
+        return self._client._commit([('create', self, document_data, None)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self, field_updates, option)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self, None, option)])[0].update_time
+
+
+class MemoryQuery:
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None,
+                 offset=0, cursor=None, fields=None):
+        self._client = client
+        self._collection = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy_with(self, **changes):
+        params = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      offset=self._offset, cursor=self._cursor, fields=self._fields)
+        params.update(changes)
+        return MemoryQuery(self._client, self._collection, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy_with(filters=self._filters + ((str(field_path), op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy_with(orders=self._orders + ((str(field_path), direction),))
+
+    def limit(self, count):
+        return self._copy_with(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy_with(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy_with(fields=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy_with(cursor=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy_with(cursor=(document_fields_or_snapshot, True))
+
+    def stream(self, transaction=None):
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def on_snapshot(self, callback):
+        return self._client._listen(self, callback)
+
+    # Evaluation helpers used by the client
+
+    def _accepts(self, doc_id, data):
+        if not all(_matches(doc_id, data, f, op, v) for f, op, v in self._filters):
+            return False
+        # Firestore drops documents missing an ordered field
+        return all(_field(doc_id, data, f) is not _MISSING for f, _ in self._orders)
+
+    def _sort_values(self, doc_id, data):
+        return [_field(doc_id, data, f) for f, _ in self._orders] + [doc_id]
+
+    def _directions(self):
+        directions = [d for _, d in self._orders]
+        return directions + [directions[-1] if directions else 'ASCENDING']
+
+    def _compare_rows(self, a, b):
+        for x, y, direction in zip(a, b, self._directions()):
+            result = _compare(x, y)
+            if result:
+                return -result if direction == 'DESCENDING' else result
+        return 0
+
+    def _cursor_values(self):
+        cursor, _ = self._cursor
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            return self._sort_values(cursor.id, cursor._data or {})
+        # A dict cursor only pins the ordered fields
+        return [cursor.get(f) for f, _ in self._orders]
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, collection_name):
+        super().__init__(client, collection_name)
+        self.id = collection_name
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, self._collection, document_id or _auto_id())
+
+    def add(self, document_data, document_id=None):
+        doc_ref = self.document(document_id)
+        result = doc_ref.create(document_data)
+        return result.update_time, doc_ref
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id in list(self._client._collection(self._collection))]
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, option))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, MemoryDocumentReference):
+            return ref_or_query.get()
+        return ref_or_query.stream()
+
+
+def transactional(func):
+    """Counterpart of firestore.transactional: runs func(transaction, ...) atomically"""
+    @functools.wraps(func)
+    def wrapper(transaction, *args, **kwargs):
+        # Holding the store lock for the whole callback makes it serializable
+        with transaction._client._lock:
+            result = func(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return wrapper
+
+
+class _Watch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self.query = query
+        self.callback = callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._client._unlisten(self)
+
+
+class MemoryClient:
+    """Thread-safe, process-local document store with a Firestore-shaped API"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._watches = []
+        self._last_time = datetime.now(timezone.utc)
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, collection_name):
+        return MemoryCollectionReference(self, collection_name)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return MemoryTransaction(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return SimpleNamespace(last_update_time=last_update_time, exists=exists)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references:
+            yield self._get(ref, field_paths)
+
+    def _collection(self, name):
+        return self._collections.setdefault(name, {})
+
+    def _now(self):
+        # Strictly increasing so update times order writes like Firestore does
+        now = datetime.now(timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _snapshot(self, ref, entry, read_time, field_paths=None):
+        if entry is None:
+            return MemoryDocumentSnapshot(ref, None, read_time=read_time)
+        data, create_time, update_time = entry
+        if field_paths is not None:
+            data = {f: data[f] for f in field_paths if f in data}
+        return MemoryDocumentSnapshot(ref, data, create_time, update_time, read_time)
+
+    def _get(self, ref, field_paths=None):
+        with self._lock:
+            self.reads += 1
+            entry = self._collection(ref.parent.id).get(ref.id)
+            return self._snapshot(ref, entry, self._last_time, field_paths)
+
+    def _evaluate(self, query):
+        """Full, unprojected result of a query as (doc_id, entry) pairs"""
+        docs = self._collection(query._collection)
+        rows = [(doc_id, entry) for doc_id, entry in docs.items() if query._accepts(doc_id, entry[0])]
+        # Stable sorts from the last order key to the first, so each key can keep its own direction
+        rows.sort(key=lambda row: row[0], reverse=query._directions()[-1] == 'DESCENDING')
+        for field_path, direction in reversed(query._orders):
+            rows.sort(key=lambda row: _sort_key(_field(row[0], row[1][0], field_path)),
+                      reverse=direction == 'DESCENDING')
+        if query._cursor is not None:
+            cursor_values = query._cursor_values()
+            inclusive = query._cursor[1]
+
+            def past_cursor(row):
+                result = query._compare_rows(query._sort_values(row[0], row[1][0])[:len(cursor_values)],
+                                             cursor_values)
+                return result >= 0 if inclusive else result > 0
+
+            rows = [row for row in rows if past_cursor(row)]
+        rows = rows[query._offset:]
+        if query._limit is not None:
+            rows = rows[:query._limit]
+        return rows
+
+    def _run_query(self, query):
+        with self._lock:
+            rows = self._evaluate(query)
+            self.reads += max(len(rows), 1)
+            read_time = self._last_time
+            return [self._snapshot(self.collection(query._collection).document(doc_id), entry,
+                                   read_time, query._fields)
+                    for doc_id, entry in rows]
+
+    def _check_precondition(self, ref, entry, option):
+        if option is None:
+            return
+        if getattr(option, 'exists', None) is not None and (entry is not None) != option.exists:
+            raise gcp_exceptions.FailedPrecondition(f"Precondition failed for {ref.path}")
+        last_update_time = getattr(option, 'last_update_time', None)
+        if last_update_time is not None and (entry is None or entry[2] != last_update_time):
+            raise gcp_exceptions.FailedPrecondition(f"Document {ref.path} was modified")
+
+    def _commit(self, writes):
+        """Apply a list of writes atomically and notify listeners"""
+        with self._lock:
+            # Validate everything first so a failed write leaves the store untouched
+            staged = {}
+            for kind, ref, data, option in writes:
+                key = (ref.parent.id, ref.id)
+                entry = staged[key] if key in staged else self._collection(ref.parent.id).get(ref.id)
+                if kind == 'create' and entry is not None:
+                    raise gcp_exceptions.AlreadyExists(f"Document already exists: {ref.path}")
+                if kind == 'update' and entry is None:
+                    raise gcp_exceptions.NotFound(f"No document to update: {ref.path}")
+                if kind in ('update', 'delete'):
+                    self._check_precondition(ref, entry, option)
+                staged[key] = self._apply(kind, entry, data, option)
+
+            commit_time = self._now()
+            changed = []
+            for (collection_name, doc_id), entry in staged.items():
+                docs = self._collection(collection_name)
+                old = docs.get(doc_id)
+                if entry is None:
+                    docs.pop(doc_id, None)
+                else:
+                    created = old[1] if old is not None else commit_time
+                    docs[doc_id] = (entry[0], created, commit_time)
+                changed.append((collection_name, doc_id, old, docs.get(doc_id)))
+            self.writes += len(writes)
+            results = [SimpleNamespace(update_time=commit_time) for _ in writes]
+            notifications = self._pending_notifications(changed, commit_time)
+
+        for callback, docs, changes, read_time in notifications:
+            callback(docs, changes, read_time)
+        return results
+
+    @staticmethod
+    def _apply(kind, entry, data, merge):
+        if kind == 'delete':
+            return None
+        if kind == 'update' or (kind == 'set' and merge and entry is not None):
+            updated = _copy(entry[0])
+            for field_path, value in data.items():
+                target = updated
+                parts = field_path.split('.')
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = copy.deepcopy(value)
+            return (updated, None, None)
+        return (_copy(data), None, None)
+
+    # Snapshot listeners
+
+    def _listen(self, query, callback):
+        watch = _Watch(self, query, callback)
+        with self._lock:
+            # Deliver the initial snapshot before any later write can notify this watch
+            self._watches.append(watch)
+            docs = self._run_query(query)
+            changes = [SimpleNamespace(type=SimpleNamespace(name='ADDED'), document=doc,
+                                       old_index=-1, new_index=i) for i, doc in enumerate(docs)]
+            callback(docs, changes, self._last_time)
+        return watch
+
+    def _unlisten(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _pending_notifications(self, changed, read_time):
+        notifications = []
+        for watch in self._watches:
+            query = watch.query
+            changes = []
+            for collection_name, doc_id, old, new in changed:
+                if collection_name != query._collection:
+                    continue
+                was_in = old is not None and query._accepts(doc_id, old[0])
+                is_in = new is not None and query._accepts(doc_id, new[0])
+                ref = self.collection(collection_name).document(doc_id)
+                if is_in:
+                    kind = 'MODIFIED' if was_in else 'ADDED'
+                    doc = self._snapshot(ref, new, read_time)
+                elif was_in:
+                    kind = 'REMOVED'
+                    doc = self._snapshot(ref, old, read_time)
+                else:
+                    continue
+                changes.append(SimpleNamespace(type=SimpleNamespace(name=kind), document=doc,
+                                               old_index=-1, new_index=-1))
+            if changes:
+                # Listeners only consume changes; the full result list is not rebuilt per write
+                notifications.append((watch.callback, [], changes, read_time))
+        return notifications
+
+
+def _auto_id():
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(random.choices(alphabet, k=20))
+
+
+def create_memory_client(seed_books=0):
+    """Create an empty store, optionally filled with synthetic demo data"""
+    client = MemoryClient()
+    if seed_books:
+        seed_demo_data(client, books=seed_books)
+    return client
+
+
+def seed_demo_data(client, books=1000, shelves=25, owners=10, users=50, lent_ratio=0.05, seed=42):
+    """Fill the store with a deterministic synthetic library for profiling and load tests"""
+    rng = random.Random(seed)
+    words = ("history data river garden silent winter modern python empire ocean light "
+             "machine secret journey art science mountain stories poetry code city night").split()
+    first_names = "Ayesha Omar Sara Ali Maria John Fatima Hassan Emma Noah".split()
+    last_names = "Khan Ahmed Smith Malik Brown Raza Iqbal Taylor Hussain Jones".split()
+    publishers = ["Penguin", "Oxford University Press", "O'Reilly", "HarperCollins",
+                  "Vintage", "Springer", "Sang-e-Meel", "Pearson"]
+    today = datetime.now()
+    batch = client.batch()
+
+    def flush(force=False):
+        nonlocal batch
+        if len(batch) >= 500 or (force and len(batch)):
+            batch.commit()
+            batch = client.batch()
+
+    for shelf_id in range(1, shelves + 1):
+        batch.set(client.collection('bookshelves').document(), {
+            'shelf_id': shelf_id,
+            'title': f"Shelf {shelf_id}",
+            'description': f"Row {(shelf_id - 1) // 5 + 1}"
+        })
+    for i in range(1, owners + 1):
+        batch.set(client.collection('owners').document(), {
+            'owner_id': f"{i:03d}",
+            'name': f"{rng.choice(first_names)} {rng.choice(last_names)}",
+            'email': f"owner{i}@example.com",
+            'cell_phone': ''
+        })
+    flush(force=True)
+
+    borrowers = []
+    for i in range(users):
+        email = f"reader{i}@example.com"
+        name = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+        borrowers.append((email, name))
+        batch.set(client.collection('users').document(email), {
+            'email': email,
+            'gmail_id': email,
+            'display_name': name,
+            'access_level': rng.choice(['view', 'view', 'manage', 'none']),
+            'profile_created': True,
+            'full_name': name,
+            'cell_phone': '',
+            'created_at': (today - timedelta(days=rng.randint(0, 700))).isoformat(),
+            'last_login': today.isoformat(),
+            'approved_by': None,
+            'approved_at': None
+        })
+        flush()
+    flush(force=True)
+
+    for i in range(books):
+        created = today - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86400))
+        book_ref = client.collection('books').document()
+        book = {
+            'title': ' '.join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 4))),
+            'authors': f"{rng.choice(first_names)} {rng.choice(last_names)}",
+            'publisher': rng.choice(publishers),
+            'edition': rng.choice(['', '1st', '2nd', 'Revised']),
+            'publish_date': f"{rng.randint(1950, today.year)}-{rng.randint(1, 12):02d}-01",
+            'page_count': str(rng.randint(80, 900)),
+            'isbn': f"978{rng.randint(0, 10**10 - 1):010d}",
+            'preview_url': '',
+            'bookshelf_id': str(rng.randint(1, shelves)) if shelves else '',
+            'tracking_number': f"BK-{created.strftime('%Y%m%d')}-{i % 10000:04d}",
+            'owner_id': f"{rng.randint(1, owners):03d}" if owners else '',
+            'is_lent': False,
+            'lent_to': '',
+            'lent_date': '',
+            'lent_by': '',
+            'created_at': created.isoformat()
+        }
+        if borrowers and rng.random() < lent_ratio:
+            email, name = rng.choice(borrowers)
+            lent_date = today - timedelta(days=rng.randint(0, 40))
+            loan_ref = client.collection('book_loans').document()
+            book.update({'is_lent': True, 'lent_to': email,
+                         'lent_date': lent_date.strftime("%Y-%m-%d"), 'lent_by': 'admin@example.com',
+                         'active_loan_id': loan_ref.id})
+            batch.set(loan_ref, {
+                'book_id': book_ref.id,
+                'tracking_number': book['tracking_number'],
+                'book_title': book['title'],
+                'borrowed_by_email': email,
+                'borrowed_by_name': name,
+                'borrowed_date': book['lent_date'],
+                'due_date': (lent_date + timedelta(days=14)).strftime("%Y-%m-%d"),
+                'returned': False,
+                'returned_date': None,
+                'approved_by': 'admin@example.com'
+            })
+        batch.set(book_ref, book)
+        flush()
+    flush(force=True)
+    return client
@@ -0,0 +1,81 @@
+"""
+Overdue Index
+Active loans ordered by due date, with vectorized overdue / due-soon classification
+"""
+
+from datetime import date
+import numpy as np
+import pandas as pd
+
+# Dashboard buckets: (label, days until due where the bucket starts; None = no lower end).
+# A loan falls in the last bucket whose start it has reached; negative = overdue, 0 = due today.
+DUE_BUCKETS = (
+    ("31+ days overdue", None),
+    ("15-30 days overdue", -30),
+    ("8-14 days overdue", -14),
+    ("1-7 days overdue", -7),
+    ("Due today", 0),
+    ("Due in 1-3 days", 1),
+    ("Due later", 4),
+)
+OVERDUE_BUCKETS = tuple(label for label, start in DUE_BUCKETS if start is None or start < 0)
+
+# Days until due at which each bucket after the first starts
+_BUCKET_STARTS = np.array([start for _, start in DUE_BUCKETS[1:]])
+
+
+def _as_day(value):
+    return np.datetime64(value or date.today(), 'D')
+
+
+class DueDateIndex:
+    """
+    Active loans sorted by due date ('YYYY-MM-DD'), alongside a datetime64 array of
+    the same dates.
+
+    "Overdue as of today" is then a prefix of the list found by binary search, and
+    bucket counts are a handful of binary searches, so neither scans the loans.
+    Loans without a parseable due date are kept apart in `undated`.
+    """
+
+    def __init__(self, loans, complete=True):
+        # complete is False when only loans due before some cutoff were loaded
+        self.complete = complete
+        loans = list(loans)
+        # One vectorized parse; unparseable dates become NaT
+        due = pd.to_datetime(pd.Series([loan.get('due_date') for loan in loans], dtype=object),
+                             format='%Y-%m-%d', errors='coerce').to_numpy().astype('datetime64[D]')
+        dated = ~np.isnat(due)
+        order = np.flatnonzero(dated)[np.argsort(due[dated], kind='stable')]
+        self.loans = [loans[i] for i in order]
+        self.due = due[order]
+        self.undated = [loan for loan, has_date in zip(loans, dated) if not has_date]
+
+    def __len__(self):
+        return len(self.loans) + len(self.undated)
+
+    def _position(self, day, offset=0):
+        """Number of loans due before day + offset days"""
+        return int(np.searchsorted(self.due, _as_day(day) + np.timedelta64(offset, 'D'), side='left'))
+
+    def overdue(self, today=None):
+        """Loans due before today, most overdue first - O(log n + k)"""
+        return self.loans[:self._position(today)]
+
+    def due_between(self, start, end):
+        """Loans due from start to end (inclusive), soonest first"""
+        return self.loans[self._position(start):self._position(end, 1)]
+
+    def days_until_due(self, today=None, stop=None):
+        """Days from today to each loan's due date (negative = overdue), in self.loans order.
+        With stop, only the first stop loans (e.g. len(self.overdue(today))) are computed."""
+        return (self.due[:stop] - _as_day(today)).astype(int)
+
+    def classify(self, today=None, stop=None):
+        """Bucket index into DUE_BUCKETS for every loan (or the first stop), in self.loans order"""
+        return np.searchsorted(_BUCKET_STARTS, self.days_until_due(today, stop), side='right')
+
+    def bucket_counts(self, today=None):
+        """{bucket label: number of loans} - one binary search per bucket boundary"""
+        bounds = [0] + [self._position(today, start) for start in _BUCKET_STARTS] + [len(self.loans)]
+        return {label: bounds[i + 1] - bounds[i] for i, (label, _) in enumerate(DUE_BUCKETS)}
@@ -0,0 +1,172 @@
+"""
+Catalog Search Index
+Token-level inverted index over book fields with prefix matching and ranked AND queries
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+# Relative importance of a match in each field
+FIELD_WEIGHTS = {
+    'title': 5.0,
+    'authors': 3.0,
+    'tracking_number': 3.0,
+    'isbn': 3.0,
+    'publisher': 1.0,
+    'year': 1.0,
+}
+
+# A query token that is only a prefix of the indexed token scores this fraction of a full match
+PREFIX_MATCH_FACTOR = 0.5
+
+_TOKEN_RE = re.compile(r'\w+')
+_CODE_RE = re.compile(r'[\d\-\s]+[xX]?')  # ISBN-like input typed with dashes or spaces
+
+
+def tokenize(text):
+    """Lowercase word tokens of a field value"""
+    if isinstance(text, list):
+        text = ' '.join(str(t) for t in text)
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+
+def _compact(text):
+    return re.sub(r'[\W_]', '', str(text or '')).lower()
+
+
+def _book_tokens(book):
+    """token -> best field weight for one book"""
+    weights = {}
+    fields = {
+        'title': book.get('title'),
+        'authors': book.get('authors'),
+        'publisher': book.get('publisher'),
+        'isbn': book.get('isbn'),
+        'tracking_number': book.get('tracking_number'),
+        'year': (book.get('publish_date') or '')[:4],
+    }
+    for field, value in fields.items():
+        tokens = tokenize(value)
+        if field in ('isbn', 'tracking_number') and value:
+            # Also index the code without separators so "9780134..." finds "978-0-13-4..."
+            tokens.append(_compact(value))
+        for token in tokens:
+            weights[token] = max(weights.get(token, 0.0), FIELD_WEIGHTS[field])
+    return weights
+
+
+def query_tokens(query):
+    """Tokens of a search box entry"""
+    query = (query or '').strip()
+    if _CODE_RE.fullmatch(query) and len(_compact(query)) >= 4:
+        return [_compact(query)]
+    return tokenize(query)
+
+
+class SearchIndex:
+    """
+    Inverted index: token -> {book_id: weight}.
+
+    A sorted token list makes prefix lookups a bisect plus a short scan, so query
+    cost depends on how many tokens/books match, not on catalog size. All query
+    tokens must match (AND); results are ranked by summed field weights.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_tokens = {}
+        self._sort_keys = {}
+        self._tokens = []  # sorted; may hold tokens whose postings emptied out
+        self.version = None
+
+    def rebuild(self, books, version):
+        """Index a full set of books"""
+        with self._lock:
+            self._postings = {}
+            self._doc_tokens = {}
+            self._sort_keys = {}
+            for book in books:
+                self._add(book['id'], book)
+            self._tokens = sorted(self._postings)
+            self.version = version
+
+    def update(self, changed, version):
+        """Apply {book_id: record or None} changes"""
+        with self._lock:
+            for book_id, book in changed.items():
+                self._remove(book_id)
+                if book is not None:
+                    for token in self._add(book_id, book):
+                        if len(self._postings[token]) == 1:
+                            # Possibly a new token - make sure it is in the sorted list
+                            i = bisect_left(self._tokens, token)
+                            if i == len(self._tokens) or self._tokens[i] != token:
+                                insort(self._tokens, token)
+            if len(self._tokens) > 2 * max(len(self._postings), 1000):
+                # Too many dead tokens left behind by removals - compact
+                self._tokens = sorted(self._postings)
+            self.version = version
+
+    def sync(self, get_changes, get_snapshot):
+        """
+        Catch up with a versioned source: get_changes(version) -> (version, changed or None),
+        get_snapshot() -> (version, books). Rebuilds only when changes are unavailable.
+        """
+        with self._lock:
+            version, changed = get_changes(self.version)
+            if version == self.version:
+                return
+            if changed is None:
+                version, books = get_snapshot()
+                self.rebuild(books, version)
+            else:
+                self.update(changed, version)
+
+    def _add(self, book_id, book):
+        weights = _book_tokens(book)
+        for token, weight in weights.items():
+            self._postings.setdefault(token, {})[book_id] = weight
+        self._doc_tokens[book_id] = weights.keys()
+        self._sort_keys[book_id] = (book.get('title') or '').lower()
+        return weights.keys()
+
+    def _remove(self, book_id):
+        for token in self._doc_tokens.pop(book_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(book_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._sort_keys.pop(book_id, None)
+
+    def _matches(self, query_token):
+        """book_id -> score for one query token (exact and prefix matches)"""
+        scores = {}
+        for i in range(bisect_left(self._tokens, query_token), len(self._tokens)):
+            token = self._tokens[i]
+            if not token.startswith(query_token):
+                break
+            factor = 1.0 if token == query_token else PREFIX_MATCH_FACTOR
+            for book_id, weight in self._postings.get(token, {}).items():
+                score = weight * factor
+                if score > scores.get(book_id, 0.0):
+                    scores[book_id] = score
+        return scores
+
+    def search(self, query, limit=None):
+        """Ranked list of book IDs matching every token of query"""
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        with self._lock:
+            per_token = sorted((self._matches(token) for token in dict.fromkeys(tokens)), key=len)
+            totals = dict(per_token[0])
+            for scores in per_token[1:]:
+                totals = {book_id: total + scores[book_id]
+                          for book_id, total in totals.items() if book_id in scores}
+                if not totals:
+                    return []
+            ranked = sorted(totals, key=lambda book_id: (-totals[book_id], self._sort_keys.get(book_id, '')))
+        return ranked[:limit] if limit else ranked
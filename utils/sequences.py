@@ -0,0 +1,80 @@
+"""
+Sequence Allocator
+Hands out unique, increasing numbers from per-key counter documents
+"""
+
+import threading
+from datetime import datetime
+
+# Collection holding one counter document per sequence key
+COUNTERS_COLLECTION = 'counters'
+
+
+class SequenceAllocator:
+    """
+    Allocates numbers from counter documents incremented inside a transaction.
+
+    Each allocation costs one counter read + one write, however large the
+    collections grow, and concurrent callers never receive the same number.
+    With block_size > 1 a whole range is reserved in one transaction and handed
+    out locally; numbers left in a block when the process exits are skipped.
+    """
+
+    def __init__(self, db, transactional):
+        self._db = db
+        self._transactional = transactional
+        self._lock = threading.Lock()
+        self._blocks = {}  # key -> [next value, last reserved value]
+
+    def allocate(self, key, block_size=1, seed=None):
+        """
+        Returns the next number for key.
+
+        seed() is called only when the counter document does not exist yet and
+        must return the highest number already in use (e.g. from legacy data).
+        """
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                last = self._reserve(key, block_size, None)
+                if last is None:
+                    # First use of this key: seed outside the transaction, then retry
+                    last = self._reserve(key, block_size, seed() if seed else 0)
+                block = self._blocks[key] = [last - block_size + 1, last]
+            value = block[0]
+            block[0] += 1
+            return value
+
+    def peek(self, key, seed=None):
+        """Returns the number the next allocate() would most likely return (one read at most)"""
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None and block[0] <= block[1]:
+                return block[0]
+        snapshot = self._counter_ref(key).get()
+        if snapshot.exists:
+            return snapshot.to_dict().get('value', 0) + 1
+        return (seed() if seed else 0) + 1
+
+    def _counter_ref(self, key):
+        return self._db.collection(COUNTERS_COLLECTION).document(key)
+
+    def _reserve(self, key, count, start):
+        """Advance the counter by count; returns the new value, or None if it is missing and start is None"""
+        counter_ref = self._counter_ref(key)
+
+        def reserve(transaction):
+            snapshot = counter_ref.get(transaction=transaction)
+            if snapshot.exists:
+                current = snapshot.to_dict().get('value', 0)
+            elif start is None:
+                return None
+            else:
+                current = start
+            transaction.set(counter_ref, {
+                'value': current + count,
+                'updated_at': datetime.now().isoformat()
+            })
+            return current + count
+
+        return self._transactional(reserve)(self._db.transaction())